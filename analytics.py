@@ -0,0 +1,195 @@
+from array import array
+import numpy as np
+from cards import CATALOG, DECK_SIZE, PAD
+from corpus import parse_battle_time
+from tagset import decode_tag
+
+WIN, DRAW, LOSS = 1, 0, -1
+TEAM, OPPONENT = 0, 1
+
+
+class BattleTable:
+    """Battle logs flattened into column arrays for aggregate analysis.
+
+    One row per battle from the point of view of the player whose log it
+    came from (`player`, `outcome`, crowns, time), and one row per deck in
+    it (`deck_battle` -> battle row, `deck_side` TEAM/OPPONENT, `decks` ->
+    DECK_SIZE card ids from the shared CardCatalog). A 1v1 battle is about
+    40 bytes, and every aggregate is a bincount over those arrays instead of
+    a Python loop per battle and per card, so a whole clan or crawl is as
+    cheap to analyse as a single player.
+    """
+
+    def __init__(self, catalog=CATALOG):
+        self.catalog = catalog
+        self.players = []
+        self.player_ids = {}
+        self._player = array("i")
+        self._outcome = array("b")
+        self._crowns = array("b")
+        self._crowns_against = array("b")
+        self._time = array("q")
+        self._decks = bytearray()
+        self._deck_battle = array("i")
+        self._deck_side = array("b")
+        self._frozen = None
+
+    @classmethod
+    def from_logs(cls, logs, catalog=CATALOG):
+        """`logs`: {player tag: battle log} or an iterable of (tag, battle log) pairs."""
+        table = cls(catalog)
+        for tag, battles in (logs.items() if isinstance(logs, dict) else logs):
+            table.add(tag, battles)
+        return table
+
+    @classmethod
+    def from_corpus(cls, corpus, tags=None, limit=25):
+        """Straight from a BattleCorpus' rows, without rebuilding API dicts.
+
+        The corpus stores decks with its catalog's ids, so they are copied
+        as they are. With tags=None, every stored battle once, from the side
+        of its first participant: the crawl-wide view.
+        """
+        table = cls(corpus.catalog)
+        deck_of = corpus.deck
+        for tag, rows in corpus.rows(tags, limit):
+            current, row, for_crowns, against = None, None, 0, 0
+            for battle, seconds, mode, my_side, ptag, side, crowns, trophies, deck in rows:
+                if battle != current:
+                    if current is not None:
+                        table._close(row, for_crowns, against)
+                    current, for_crowns, against = battle, 0, 0
+                    row = table._open(tag if tag is not None else decode_tag(ptag), seconds)
+                table._add_deck(row, TEAM if side == my_side else OPPONENT, deck_of(deck))
+                if side == my_side:
+                    for_crowns += crowns or 0
+                else:
+                    against += crowns or 0
+            if current is not None:
+                table._close(row, for_crowns, against)
+        return table
+
+    def _open(self, tag, seconds):
+        i = self.player_ids.get(tag)
+        if i is None:
+            i = self.player_ids[tag] = len(self.players)
+            self.players.append(tag)
+        self._player.append(i)
+        self._time.append(seconds)
+        self._frozen = None
+        return len(self._player) - 1
+
+    def _close(self, row, crowns, against):
+        self._outcome.append(WIN if crowns > against else (LOSS if crowns < against else DRAW))
+        self._crowns.append(min(crowns, 127))
+        self._crowns_against.append(min(against, 127))
+
+    def _add_deck(self, row, side, deck):
+        self._decks += deck
+        self._deck_battle.append(row)
+        self._deck_side.append(side)
+
+    def add(self, tag, battles):
+        deck = self.catalog.deck
+        for b in battles:
+            row = self._open(tag, parse_battle_time(b.get('battleTime')))
+            crowns = against = 0
+            for p in b.get('team', []):
+                crowns += p.get('crowns', 0)
+                self._add_deck(row, TEAM, deck(p.get('cards', [])))
+            for p in b.get('opponent', []):
+                against += p.get('crowns', 0)
+                self._add_deck(row, OPPONENT, deck(p.get('cards', [])))
+            self._close(row, crowns, against)
+
+    def __len__(self):
+        return len(self._outcome)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self._player, self._outcome, self._crowns, self._crowns_against,
+                                                  self._time, self._deck_battle, self._deck_side)) + len(self._decks)
+
+    def columns(self):
+        """numpy copies of the columns, rebuilt only after new battles were added.
+
+        Copies rather than views: an array exporting its buffer can no longer grow.
+        """
+        if self._frozen is None:
+            self._frozen = {
+                "player": np.frombuffer(self._player, dtype=np.int32).copy(),
+                "outcome": np.frombuffer(self._outcome, dtype=np.int8).copy(),
+                "crowns": np.frombuffer(self._crowns, dtype=np.int8).copy(),
+                "crowns_against": np.frombuffer(self._crowns_against, dtype=np.int8).copy(),
+                "time": np.frombuffer(self._time, dtype=np.int64).copy(),
+                "decks": np.frombuffer(bytes(self._decks), dtype=np.uint8).reshape(-1, DECK_SIZE),
+                "deck_battle": np.frombuffer(self._deck_battle, dtype=np.int32).copy(),
+                "deck_side": np.frombuffer(self._deck_side, dtype=np.int8).copy(),
+            }
+        return self._frozen
+
+    def _battle_mask(self, players):
+        cols = self.columns()
+        if players is None:
+            return None
+        ids = [self.player_ids[t] for t in players if t in self.player_ids]
+        return np.isin(cols["player"], ids)
+
+    def record(self, players=None):
+        """{"battles", "wins", "losses", "draws", "win_rate"} over all battles or only `players`' logs."""
+        outcome = self.columns()["outcome"]
+        mask = self._battle_mask(players)
+        if mask is not None:
+            outcome = outcome[mask]
+        wins, losses = int((outcome == WIN).sum()), int((outcome == LOSS).sum())
+        total = len(outcome)
+        return {"battles": total, "wins": wins, "losses": losses, "draws": total - wins - losses,
+                "win_rate": wins / total * 100 if total else 0.0}
+
+    def per_player(self):
+        """Column dict: tag, battles, wins, losses, win_rate for every player in the table."""
+        cols = self.columns()
+        n = len(self.players)
+        battles = np.bincount(cols["player"], minlength=n)
+        wins = np.bincount(cols["player"], weights=cols["outcome"] == WIN, minlength=n).astype(int)
+        losses = np.bincount(cols["player"], weights=cols["outcome"] == LOSS, minlength=n).astype(int)
+        return {"tag": np.array(self.players, dtype=object), "battles": battles, "wins": wins, "losses": losses,
+                "win_rate": np.round(np.divide(wins * 100, battles, out=np.zeros(n), where=battles > 0), 1)}
+
+    def card_matchups(self, players=None, min_count=1, side=OPPONENT):
+        """Win/loss per card as a dict of columns: card, total, wins, losses, draws, win_rate.
+
+        side=OPPONENT counts the cards played against the players whose logs
+        were added, side=TEAM the cards in their own decks. Cards met fewer
+        than `min_count` times are left out.
+        """
+        cols = self.columns()
+        keep = cols["deck_side"] == side
+        if players is not None:
+            keep &= self._battle_mask(players)[cols["deck_battle"]]
+        decks = cols["decks"][keep]
+        outcome = np.repeat(cols["outcome"][cols["deck_battle"][keep]], DECK_SIZE)
+        ids = decks.ravel()
+        n = len(self.catalog)
+        total = np.bincount(ids, minlength=PAD + 1)[:n]
+        wins = np.bincount(ids, weights=outcome == WIN, minlength=PAD + 1)[:n].astype(int)
+        losses = np.bincount(ids, weights=outcome == LOSS, minlength=PAD + 1)[:n].astype(int)
+        shown = total >= max(1, min_count)
+        total, wins, losses = total[shown], wins[shown], losses[shown]
+        return {
+            "card": np.array(self.catalog.names[:n], dtype=object)[shown],
+            "total": total,
+            "wins": wins,
+            "losses": losses,
+            "draws": total - wins - losses,
+            "win_rate": np.round(wins * 100 / np.maximum(total, 1), 1),
+        }
+
+
+def top(columns, key, n=10, ascending=False):
+    """First `n` rows of a column dict sorted on `key`, as a list of row dicts."""
+    order = np.argsort(columns[key], kind="stable")
+    if not ascending:
+        order = order[::-1]
+    names = list(columns)
+    return [{name: columns[name][i].item() if hasattr(columns[name][i], "item") else columns[name][i] for name in names}
+            for i in order[:n]]
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+import aiohttp
+from clash_api import APIUnavailable, RETRY_STATUS
+from crawler import Crawler
+
+
+class AsyncClashAPI:
+    """asyncio counterpart of ClashAPI; shares its keys, rate buckets and retry policy."""
+
+    def __init__(self, api, concurrency=100):
+        self.api = api
+        self.concurrency = concurrency
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=10),
+            headers={"Accept": "application/json"},
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _get(self, path, headers=None):
+        attempt = 0
+        while True:
+            key = self.api.pick_key()
+            try:
+                await key.limiter.acquire_async()
+                async with self.session.get(f"{self.api.base_url}{path}", headers={**key.headers, **(headers or {})}) as r:
+                    status, response_headers = r.status, r.headers
+                    body = await r.read() if status == 200 else b""
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status, response_headers, body = None, {}, b""
+            finally:
+                self.api.release_key(key)
+            if status is not None and status != 403 and status not in RETRY_STATUS:
+                return status, response_headers, body
+            if status != 403 and attempt == self.api.max_retries:
+                raise APIUnavailable(path)
+            await asyncio.sleep(self.api.backoff(key, status, response_headers, attempt))
+            if status != 403:
+                attempt += 1
+
+    async def _fetch(self, kind, path):
+        return (await self._fetch_timed(kind, path))[0]
+
+    async def _fetch_timed(self, kind, path):
+        # (data, when the API last sent it), as ClashAPI._fetch_timed.
+        # SQLite reads and writes run on worker threads: on the loop they would stall every request in flight
+        cache = self.api.cache
+        if not cache:
+            status, _, body = await self._get(path)
+            return (json.loads(body) if status == 200 else None), time.time()
+        entry = await asyncio.to_thread(cache.lookup, kind, path)
+        if entry and entry.fresh:
+            return await asyncio.to_thread(cache.load, entry), entry.fetched_at
+        status, headers, body = await self._get(path, cache.validators(entry))
+        return await asyncio.to_thread(cache.store, kind, path, entry, status, headers, lambda: json.loads(body)), time.time()
+
+    async def get_battle_log(self, tag):
+        battles, fetched = await self._fetch_timed("battlelog", f"/players/{tag.replace('#', '%23')}/battlelog")
+        battles = battles or []
+        if self.api.corpus is not None:
+            # add() may flush a whole batch
+            await asyncio.to_thread(self.api.corpus.add, tag, battles, fetched)
+        return battles
+
+    async def get_player(self, tag):
+        return await self._fetch("player", f"/players/{tag.replace('#', '%23')}")
+
+    async def get_clan(self, tag):
+        return await self._fetch("clan", f"/clans/{tag.replace('#', '%23')}")
+
+
+class AsyncCrawler(Crawler):
+    """Same crawl as Crawler, but on one event loop with `workers` requests in flight.
+
+    Without a thread per request, hundreds of lookups can be outstanding at
+    once; the shared per-key rate limiter is what bounds the request rate.
+    """
+
+    def __init__(self, api, seed_tag, min_trophies, max_trophies, min_scan, objectif, workers=100, skip=None, checkpoint=None, visited=None, frontier=None, min_yield=0.0):
+        super().__init__(api, seed_tag, min_trophies, max_trophies, min_scan, objectif, workers, skip, checkpoint, visited, frontier, min_yield)
+
+    async def crawl(self, emit):
+        in_flight = self.workers
+        max_expanding = max(1, self.workers // 4)
+        expanding = 0
+        pending = {}
+        in_flight_jobs = []
+        completed = False
+        try:
+            for event in self.restore():
+                emit(event)
+            async with AsyncClashAPI(self.api, self.workers) as client:
+                fetch = {"battlelog": client.get_battle_log, "recruit": client.get_battle_log, "player": client.get_player}
+                while not self.finished():
+                    for kind, tag in self.schedule(len(pending), expanding, in_flight, max_expanding):
+                        pending[asyncio.ensure_future(fetch[kind](tag))] = (kind, tag)
+                        if kind == "battlelog":
+                            expanding += 1
+
+                    if not pending:
+                        completed = True
+                        break
+
+                    finished_tasks, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in finished_tasks:
+                        kind, tag = pending.pop(task)
+                        if kind == "battlelog":
+                            expanding -= 1
+                        for event in self.handle(kind, tag, task.result):
+                            emit(event)
+                        if self.finished():
+                            break
+                    self.save_checkpoint(pending.values())
+                else:
+                    completed = self.running
+                in_flight_jobs = list(pending.values())
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            self.running = False
+            self.close_checkpoint(in_flight_jobs or list(pending.values()), completed)
+            emit(None)
+
+    def run(self):
+        """Run the event loop on its own thread and yield the same events as Crawler.run()."""
+        self.running = True
+        events = queue.Queue()
+        thread = threading.Thread(target=lambda: asyncio.run(self.crawl(events.put)), daemon=True)
+        thread.start()
+        try:
+            while (event := events.get()) is not None:
+                yield event
+        finally:
+            self.stop()
+            thread.join()
@@ -0,0 +1,295 @@
+"""Local benchmarks against a mock Clash Royale API.
+
+    python bench.py crawl --latency 0.05 --objectif 300
+    python bench.py visited --tags 1000000
+    python bench.py frontier [--graph ~/.local/share/cr-recruiter/api_cache.sqlite --seed "#989R2RPQ"]
+    python bench.py pruning --runs 8
+"""
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from clash_api import ClashAPI
+from crawler import Crawler
+from frontier import FifoFrontier, PriorityFrontier
+from tagset import ALPHABET, BloomFilter, TagSet
+
+
+# --- MOCK API ---
+class MockGraph:
+    """Deterministic fake player graph: same tag always gives the same profile and battles.
+
+    Trophies grow with the player index and opponents are drawn within
+    `spread` indexes, so like ladder matchmaking a player mostly meets
+    others of similar trophies. How many players have a clan varies by
+    blocks of `region` indexes around the `clan_rate` average.
+    """
+
+    def __init__(self, players=20000, clan_rate=0.8, spread=1000, region=500, seed=0):
+        self.players = players
+        self.clan_rate = clan_rate
+        self.spread = spread
+        self.region = region
+        self.seed = seed
+
+    def tag(self, i):
+        # Real tag alphabet, 8 characters like most live accounts
+        chars = []
+        for _ in range(8):
+            i, d = divmod(i, len(ALPHABET))
+            chars.append(ALPHABET[d])
+        return "#" + "".join(reversed(chars))
+
+    def index(self, tag):
+        i = 0
+        for c in tag.lstrip("#"):
+            if c not in ALPHABET:
+                return 0
+            i = i * len(ALPHABET) + ALPHABET.index(c)
+        return i
+
+    def region_clan_rate(self, i):
+        # Some neighbourhoods are almost all in clans, others are full of free players
+        r = random.Random(self.seed * 3_000_017 + i // self.region)
+        return 0.97 if r.random() < 0.5 else 2 * self.clan_rate - 0.97
+
+    def index_for(self, trophies):
+        return min(self.players - 1, max(0, (trophies - 5000) * self.players // 7000))
+
+    def player(self, tag):
+        i = self.index(tag)
+        r = random.Random(self.seed * 1_000_003 + i)
+        trophies = 5000 + 7000 * i // self.players + int(r.gauss(0, 100))
+        p = {
+            "tag": tag,
+            "name": f"Joueur {i}",
+            "trophies": trophies,
+            "bestTrophies": trophies + r.randint(0, 1500),
+            "currentFavouriteCard": {"name": f"Carte {r.randint(0, 110)}"},
+        }
+        if r.random() < self.region_clan_rate(i):
+            p["clan"] = {"tag": "#CLAN", "name": "Clan"}
+        return p
+
+    def battle_log(self, tag):
+        i = self.index(tag)
+        r = random.Random(self.seed * 7_000_003 + i)
+        battles = []
+        for n in range(25):
+            opp = self.tag(min(self.players - 1, max(0, i + r.randint(-self.spread, self.spread))))
+            battles.append({
+                "type": "PvP",
+                "battleTime": f"202610{10 + n % 9:02d}T1{n % 10}0000.000Z",
+                "team": [{"tag": tag, "crowns": r.randint(0, 3), "cards": [{"name": f"Carte {r.randint(0, 110)}"} for _ in range(8)]}],
+                "opponent": [{"tag": opp, "crowns": r.randint(0, 3), "cards": [{"name": f"Carte {r.randint(0, 110)}"} for _ in range(8)]}],
+            })
+        return battles
+
+
+class RecordedGraph:
+    """Player graph replayed from a response cache (api_cache.sqlite in paths.DATA_DIR) filled by a real crawl."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def body(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def player(self, tag):
+        return self.body(f"/players/{tag.replace('#', '%23')}")
+
+    def battle_log(self, tag):
+        return self.body(f"/players/{tag.replace('#', '%23')}/battlelog") or []
+
+
+class GraphAPI:
+    """In-process stand-in for ClashAPI over a graph, counting the requests it answers."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    def get_player(self, tag):
+        self.count()
+        return self.graph.player(tag)
+
+    def get_battle_log(self, tag):
+        self.count()
+        return self.graph.battle_log(tag)
+
+
+class MockAPI:
+    """Threaded HTTP/1.1 server on localhost serving MockGraph with a fixed latency."""
+
+    def __init__(self, graph=None, latency=0.05):
+        self.graph = graph or MockGraph()
+        self.latency = latency
+        self.requests = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                mock.requests += 1
+                time.sleep(mock.latency)
+                path = unquote(self.path)
+                if path.endswith("/battlelog"):
+                    body = mock.graph.battle_log(path.split("/")[-2])
+                else:
+                    body = mock.graph.player(path.split("/")[-1])
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        ThreadingHTTPServer.request_queue_size = 1024
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def timed_crawl(crawler):
+    start = time.perf_counter()
+    for _ in crawler.run():
+        pass
+    elapsed = time.perf_counter() - start
+    return crawler.scanned, len(crawler.found), elapsed
+
+
+# --- BENCHMARKS ---
+def bench_crawl(args):
+    from async_crawler import AsyncCrawler
+
+    with MockAPI(latency=args.latency) as mock:
+        print(f"Mock API {mock.url} (latence {args.latency * 1000:.0f} ms, objectif {args.objectif})")
+        engines = [(f"threads x{w}", Crawler, w) for w in (5, 10)]
+        engines += [(f"asyncio x{c}", AsyncCrawler, c) for c in (50, 200)]
+        for label, engine, workers in engines:
+            api = ClashAPI("bench", workers=workers, rate=args.rate, base_url=mock.url)
+            crawler = engine(api, mock.graph.tag(mock.graph.index_for(7000)), 7500, 11000, 7000, args.objectif, workers)
+            scanned, found, elapsed = timed_crawl(crawler)
+            print(f"{label:<14} {scanned:>6} profils  {found:>4} recrues  {elapsed:6.2f} s  {scanned / elapsed:8.1f} profils/s")
+            api.close()
+
+
+def random_tags(n, seed):
+    r = random.Random(seed)
+    return ["#" + "".join(r.choices(ALPHABET, k=9)) for _ in range(n)]
+
+
+def bench_visited(args):
+    # Kept as bytes so every store gets fresh strings, as they come out of the JSON responses
+    raw = [t.encode() for t in random_tags(args.tags, 1)]
+    absent = random_tags(args.tags // 10, 2)
+    present = [t.decode() for t in raw[:args.tags // 10]]
+    print(f"{args.tags} tags, {len(present)} recherches présentes + {len(absent)} absentes")
+    stores = [
+        ("set", set),
+        ("TagSet", TagSet),
+        ("Bloom 0.1%", lambda: BloomFilter(capacity=args.tags, error_rate=0.001)),
+        ("Bloom 1%", lambda: BloomFilter(capacity=args.tags, error_rate=0.01)),
+    ]
+    for label, make in stores:
+        # tracemalloc slows allocations down a lot: measure memory and time in separate passes
+        tracemalloc.start()
+        store = make()
+        for tag in raw:
+            store.add(tag.decode())
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del store
+        start = time.perf_counter()
+        store = make()
+        for tag in raw:
+            store.add(tag.decode())
+        insert = time.perf_counter() - start
+        start = time.perf_counter()
+        hits = sum(tag in store for tag in present)
+        false_hits = sum(tag in store for tag in absent)
+        lookup = (time.perf_counter() - start) / (len(present) + len(absent))
+        print(f"{label:<11} {memory / 2**20:8.1f} Mo  {memory / args.tags:6.1f} o/tag  "
+              f"ajout {insert / args.tags * 1e9:6.0f} ns  recherche {lookup * 1e9:6.0f} ns  "
+              f"trouvés {hits}/{len(present)}  faux positifs {false_hits / len(absent):.3%}")
+
+
+def bench_frontier(args):
+    if args.graph:
+        graph, seed = RecordedGraph(args.graph), args.seed
+        bands = [tuple(args.band)]
+        print(f"Graphe enregistré {args.graph}, graine {seed}")
+    else:
+        graph = MockGraph()
+        seed = graph.tag(graph.index_for(7000))
+        bands = [(7500, 11000), (9000, 9500), (10000, 11000)]
+        print(f"Graphe simulé ({graph.players} joueurs), graine {seed} à ~7000 trophées")
+    for low, high in bands:
+        for label, make in (("FIFO", FifoFrontier), ("priorité", lambda: PriorityFrontier(low, high))):
+            api = GraphAPI(graph)
+            crawler = Crawler(api, seed, low, high, 7000, args.objectif, 4, frontier=make())
+            scanned, found, elapsed = timed_crawl(crawler)
+            per_recruit = api.requests / found if found else float("inf")
+            print(f"{low}-{high} {label:<9} {api.requests:>6} requêtes  {scanned:>6} profils  {found:>4} recrues  {per_recruit:6.1f} requêtes/recrue")
+
+
+def bench_pruning(args):
+    # Averaged over several graphs: a single crawl is too noisy to compare a few percent
+    print(f"Graphes simulés, moyenne sur {args.runs} graines, objectif {args.objectif}")
+    for low, high in ((7500, 11000), (8000, 9500)):
+        results = {}
+        for min_yield in (0, 0.05):
+            per_recruit = []
+            for graph_seed in range(args.runs):
+                graph = MockGraph(seed=graph_seed)
+                api = GraphAPI(graph)
+                crawler = Crawler(api, graph.tag(graph.index_for(7600)), low, high, 7000, args.objectif, 4, min_yield=min_yield)
+                timed_crawl(crawler)
+                per_recruit.append(api.requests / max(1, crawler.summary()["recruits"]))
+            results[min_yield] = statistics.mean(per_recruit)
+        base, pruned = results[0], results[0.05]
+        print(f"{low}-{high}  sans élagage {base:5.2f} req/recrue  avec {pruned:5.2f}  économie mesurée {base - pruned:+5.2f}")
+
+
+BENCHMARKS = {"crawl": bench_crawl, "visited": bench_visited, "frontier": bench_frontier, "pruning": bench_pruning}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--latency", type=float, default=0.05, help="latence simulée par requête (s)")
+    parser.add_argument("--objectif", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=0, help="requêtes/s par clé (0 = illimité)")
+    parser.add_argument("--graph", help="cache SQLite d'un vrai crawl à rejouer (frontier)")
+    parser.add_argument("--seed", default="#989R2RPQ", help="tag graine pour --graph")
+    parser.add_argument("--band", type=int, nargs=2, default=[7500, 11000], metavar=("MIN", "MAX"), help="trophées recherchés pour --graph")
+    parser.add_argument("--runs", type=int, default=8, help="graphes simulés à moyenner (pruning)")
+    parser.add_argument("--tags", type=int, default=1_000_000, help="taille de l'ensemble visité (visited)")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,219 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from paths import data_path
+
+CACHE_FILE = data_path("api_cache.sqlite")
+
+# Seconds a response stays fresh, per endpoint, when the API sends no max-age
+DEFAULT_TTL = {
+    "battlelog": 5 * 60,
+    "player": 30 * 60,
+    "clan": 10 * 60,
+}
+
+CacheEntry = namedtuple("CacheEntry", "key version etag last_modified expires_at fresh fetched_at")
+
+
+def max_age(headers):
+    """Freshness lifetime from Cache-Control, or None if the API did not say."""
+    cache_control = headers.get("Cache-Control", "")
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+    m = re.search(r"max-age=(\d+)", cache_control)
+    return int(m.group(1)) if m else None
+
+
+class ResponseCache:
+    """SQLite cache in front of ClashAPI, shared by every thread and by both front-ends.
+
+    Entries expire after the API's max-age (or DEFAULT_TTL for the endpoint)
+    and the least recently used ones are evicted once the stored bodies
+    exceed `max_bytes`; fresh hits note their access time in memory and it
+    is written with the next store. Stale entries keep their ETag /
+    Last-Modified so the client can revalidate them with a conditional
+    request; parsed bodies are kept in memory so an unchanged response is
+    never parsed twice.
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=None, max_bytes=64 * 1024 * 1024, memory_entries=2048):
+        self.path = path
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        # key -> time of its last fresh hit, not yet written to accessed_at
+        self.accessed = {}
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )""")
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(responses)")}
+        for column in ("etag TEXT", "last_modified TEXT", "expires_at REAL"):
+            if column.split()[0] not in columns:
+                self.db.execute(f"ALTER TABLE responses ADD COLUMN {column}")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def lookup(self, kind, key):
+        """Metadata for `key` (without the body), or None. Counts a hit if it is still fresh."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT fetched_at, etag, last_modified, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            fetched_at, etag, last_modified, expires_at = row
+            if expires_at is None:
+                expires_at = fetched_at + self.ttl.get(kind, 0)
+            now = time.time()
+            fresh = now < expires_at
+            if fresh:
+                self.hits += 1
+                self.accessed[key] = now
+            else:
+                self.misses += 1
+        return CacheEntry(key, etag or fetched_at, etag, last_modified, expires_at, fresh, fetched_at)
+
+    def load(self, entry):
+        """Parsed body of `entry`, from memory when this version was already parsed."""
+        with self.lock:
+            cached = self.memory.get(entry.key)
+            if cached and cached[0] == entry.version:
+                self.memory.move_to_end(entry.key)
+                return cached[1]
+            row = self.db.execute("SELECT body FROM responses WHERE key = ?", (entry.key,)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        self._remember(entry.key, entry.version, data)
+        return data
+
+    def get(self, kind, key):
+        entry = self.lookup(kind, key)
+        return self.load(entry) if entry and entry.fresh else None
+
+    def validators(self, entry):
+        """Conditional request headers for a stale entry."""
+        headers = {}
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, kind, key, entry, status, headers, parse):
+        """Record a response to a (possibly conditional) request and return its data.
+
+        `parse` is only called when the body actually changed.
+        """
+        if status == 304 and entry:
+            self._touch(kind, key, headers)
+            return self.load(entry)
+        if status != 200:
+            return None
+        etag = headers.get("ETag")
+        if entry and etag and etag == entry.etag:
+            # Same representation as the one we hold: skip the JSON parse
+            self._touch(kind, key, headers)
+            return self.load(entry)
+        data = parse()
+        self.set(kind, key, data, etag, headers.get("Last-Modified"), max_age(headers))
+        return data
+
+    def set(self, kind, key, data, etag=None, last_modified=None, max_age=None):
+        body = json.dumps(data, separators=(",", ":")).encode()
+        now = time.time()
+        expires_at = now + (max_age if max_age is not None else self.ttl.get(kind, 0))
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, body, size, fetched_at, accessed_at, etag, last_modified, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, body, len(body), now, now, etag, last_modified, expires_at),
+            )
+            self.accessed.pop(key, None)
+            self.size += len(body) - (old[0] if old else 0)
+            self._write_accessed()
+            if self.size > self.max_bytes:
+                self._evict()
+            self.db.commit()
+        self._remember(key, etag or now, data)
+
+    def _touch(self, kind, key, headers):
+        age = max_age(headers)
+        now = time.time()
+        expires_at = now + (age if age is not None else self.ttl.get(kind, 0))
+        with self.lock:
+            self.revalidated += 1
+            self.accessed.pop(key, None)
+            self.db.execute("UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?", (expires_at, now, key))
+            self.db.commit()
+
+    def _write_accessed(self):
+        # Called with the lock held; committed by the caller
+        if self.accessed:
+            self.db.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                                [(at, key) for key, at in self.accessed.items()])
+            self.accessed.clear()
+
+    def _remember(self, key, version, data):
+        with self.lock:
+            self.memory[key] = (version, data)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _evict(self):
+        # Drop least recently used entries until we are back under 90% of the budget
+        target = self.max_bytes * 0.9
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            doomed.append((key,))
+            self.size -= size
+            self.memory.pop(key, None)
+        self.db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "hit_rate": self.hits / total if total else 0.0,
+            "bytes": self.size,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+            self.memory.clear()
+            self.accessed.clear()
+            self.size = 0
+
+    def close(self):
+        with self.lock:
+            self._write_accessed()
+            self.db.commit()
+            self.db.close()
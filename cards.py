@@ -0,0 +1,74 @@
+import threading
+
+DECK_SIZE = 8
+PAD = 255  # fills the slots of a deck with fewer than DECK_SIZE cards
+MAX_CARDS = PAD  # ids 0..254 fit in one byte
+
+
+class CardCatalog:
+    """Card names mapped to small integer ids, shared by everything that aggregates over cards.
+
+    A deck is then DECK_SIZE bytes (its sorted ids, padded with PAD) instead
+    of eight dicts with name, level and icon URLs, and per-card stats are a
+    bincount over those bytes. `bits` gives the same deck as an int bitset
+    when a hashable deck identity is needed.
+    """
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        self.lock = threading.Lock()
+        for name in names:
+            self.id(name)
+
+    def id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            with self.lock:
+                i = self.ids.get(name)
+                if i is None:
+                    if len(self.names) >= MAX_CARDS:
+                        raise ValueError(f"plus de {MAX_CARDS} cartes dans le catalogue")
+                    i = self.ids[name] = len(self.names)
+                    self.names.append(name)
+        return i
+
+    def seed(self, names):
+        """Adopt the ids of a stored catalog (`names` in id order), as kept by BattleCorpus.
+
+        Raises ValueError if they disagree with ids this catalog already gave out.
+        """
+        names = list(names)
+        with self.lock:
+            common = min(len(names), len(self.names))
+            if names[:common] != self.names[:common]:
+                raise ValueError("catalogue de cartes incompatible avec celui du corpus")
+            for name in names[common:]:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+
+    def name(self, i):
+        return self.names[i]
+
+    def __len__(self):
+        return len(self.names)
+
+    def deck(self, cards):
+        """API card dicts -> DECK_SIZE sorted ids (extra cards beyond DECK_SIZE are dropped)."""
+        ids = self.ids
+        ids = sorted([ids[n] if n in ids else self.id(n) for n in (c.get('name') for c in cards)])[:DECK_SIZE]
+        return bytes(ids + [PAD] * (DECK_SIZE - len(ids)))
+
+    def bits(self, deck):
+        n = 0
+        for i in deck:
+            if i != PAD:
+                n |= 1 << i
+        return n
+
+    def deck_names(self, deck):
+        return [self.names[i] for i in deck if i != PAD]
+
+
+# One catalog per process, so ids agree between tables built by different tabs
+CATALOG = CardCatalog()
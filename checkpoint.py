@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from paths import data_path
+
+CHECKPOINT_DIR = data_path("crawl_checkpoint")
+FILES = ("state.json", "frontier.txt", "visited.txt")
+
+# Directories held by a crawl running in this process (Streamlit sessions share one)
+_active = set()
+_active_lock = threading.Lock()
+
+
+def filters_key(filters):
+    return hashlib.blake2b(json.dumps(filters, sort_keys=True).encode(), digest_size=6).hexdigest()
+
+
+def write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """On-disk crawl state so a closed window or a Streamlit rerun can pick up where it stopped.
+
+    Each front-end (`owner`) and set of filters gets its own directory,
+    <root>/<owner>-<filters hash>, chosen by `bind` when the crawl starts;
+    while another crawl of this process holds it, a fresh one is started
+    beside it (-2, -3...). Clearing (resume off, crawl finished) only
+    ever touches that directory, never another crawl's.
+
+    Files in `path`:
+      visited.txt   append-only, one tag per line; each save only appends the new tags
+      frontier.txt  frontier (queue then candidates), replaced atomically; the
+                    queue as the frontier's own `dump` lines, so a priority
+                    frontier is saved unsorted and keeps its scores
+      state.json    filters, counters, found rows and how many lines of the two files are valid
+
+    state.json is replaced last, so a crash mid-save leaves the previous
+    checkpoint readable (a torn tail in visited.txt is ignored).
+    """
+
+    def __init__(self, owner="default", resume=True, root=CHECKPOINT_DIR, interval=5.0):
+        self.owner = owner
+        self.resume = resume
+        self.root = root
+        self.path = None
+        self.interval = interval
+        self.last_save = time.monotonic()
+        self.visited_lines = 0
+
+    def bind(self, filters):
+        """Take the directory for these filters; without `resume`, start it empty."""
+        base = os.path.join(self.root, f"{self.owner}-{filters_key(filters)}")
+        with _active_lock:
+            path, n = base, 1
+            while path in _active:
+                n += 1
+                path = f"{base}-{n}"
+            _active.add(path)
+        self.path = path
+        self.visited_lines = 0
+        if not self.resume:
+            self.clear()
+
+    def release(self):
+        with _active_lock:
+            _active.discard(self.path)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def exists(self):
+        return os.path.exists(self.file("state.json"))
+
+    def due(self):
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, crawler, in_flight=()):
+        os.makedirs(self.path, exist_ok=True)
+        # Requests still in flight go back to the front of the frontier;
+        # recruits waiting on their battle log are simply checked again
+        queue, candidates = [], list(crawler.awaiting)
+        for kind, tag in in_flight:
+            if kind == "battlelog":
+                queue.append(tag)
+            elif kind == "player":
+                candidates.append(tag)
+
+        if crawler.new_visited:
+            with open(self.file("visited.txt"), "a", encoding="utf-8") as f:
+                f.write("\n".join(crawler.new_visited) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.visited_lines += len(crawler.new_visited)
+            crawler.new_visited = []
+
+        queue.extend(crawler.queue.dump())
+        queue.extend(crawler.pruned)
+        candidates.extend(crawler.candidates)
+        candidates.extend(crawler.pruned_candidates)
+        write_atomic(self.file("frontier.txt"), "\n".join(queue + candidates))
+        state = {
+            "filters": crawler.filters(),
+            "scanned": crawler.scanned,
+            "requests": crawler.requests,
+            "found": crawler.found,
+            "visited_lines": self.visited_lines,
+            "queue_lines": len(queue),
+            "candidate_lines": len(candidates),
+            "saved_at": time.time(),
+        }
+        write_atomic(self.file("state.json"), json.dumps(state, ensure_ascii=False))
+        self.last_save = time.monotonic()
+
+    def matches(self, filters):
+        """True unless state.json is readable and was saved with other filters."""
+        try:
+            with open(self.file("state.json"), encoding="utf-8") as f:
+                return json.load(f)["filters"] == filters
+        except (OSError, ValueError, KeyError):
+            return True
+
+    def load(self, crawler):
+        """Restore `crawler` from disk. Returns False if there is nothing matching to resume."""
+        if not self.exists():
+            return False
+        try:
+            with open(self.file("state.json"), encoding="utf-8") as f:
+                state = json.load(f)
+            if state["filters"] != crawler.filters():
+                return False
+            with open(self.file("visited.txt"), encoding="utf-8") as f:
+                visited = f.read().split("\n")[:state["visited_lines"]]
+            with open(self.file("frontier.txt"), encoding="utf-8") as f:
+                frontier = f.read().split("\n") if state["queue_lines"] + state["candidate_lines"] else []
+        except (OSError, ValueError, KeyError):
+            return False
+
+        queue_lines = state["queue_lines"]
+        crawler.visited.clear()
+        crawler.visited.update(visited)
+        crawler.queue.clear()
+        crawler.queue.load(frontier[:queue_lines])
+        crawler.candidates.clear()
+        crawler.candidates.extend(frontier[queue_lines:queue_lines + state["candidate_lines"]])
+        crawler.found = state["found"]
+        crawler.scanned = state["scanned"]
+        crawler.requests = state.get("requests", 0)
+        crawler.new_visited = []
+        self.visited_lines = len(visited)
+        # Rewrite the log so a torn tail from a crash is not read back later
+        write_atomic(self.file("visited.txt"), "\n".join(visited) + "\n" if visited else "")
+        return True
+
+    def clear(self):
+        for name in FILES:
+            try:
+                os.remove(self.file(name))
+            except OSError:
+                pass
+        self.visited_lines = 0
@@ -0,0 +1,279 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "https://api.clashroyale.com/v1"
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class APIUnavailable(Exception):
+    """The API kept throttling or failing after every retry."""
+
+
+class NoValidKey(APIUnavailable):
+    """Every configured key has been revoked or rejected."""
+
+
+class RateLimiter:
+    """Thread-safe token bucket shared by every worker using the same key."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate or 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token if one is available; otherwise return how long to wait before trying again."""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            if now < self.resume_at:
+                return self.resume_at - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while (wait := self.reserve()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while (wait := self.reserve()) > 0:
+            await asyncio.sleep(wait)
+
+    def ready_in(self):
+        """Seconds until the next token is available (0 if one is ready now)."""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            if now < self.resume_at:
+                return self.resume_at - now
+            tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def pause(self, seconds):
+        # Server asked us to back off: hold every worker on this key, not just the one that got the 429
+        with self.lock:
+            now = time.monotonic()
+            self.resume_at = max(self.resume_at, now + seconds)
+            self.tokens = 0
+            self.updated = self.resume_at
+
+
+def retry_delay(headers, attempt, backoff=0.5, max_backoff=30):
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(max_backoff, float(retry_after))
+        except ValueError:
+            pass
+    return min(max_backoff, backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class APIKey:
+    """One developer key with its own rate budget; parked on 429, revoked on 403."""
+
+    def __init__(self, token, rate):
+        self.token = token
+        self.limiter = RateLimiter(rate)
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.revoked = False
+
+
+def parse_tokens(api_token):
+    if isinstance(api_token, str):
+        return [t for t in api_token.replace(",", " ").split() if t]
+    return list(api_token)
+
+
+class ClashAPI:
+    def __init__(self, api_token, workers=10, rate=20, max_retries=5, cache=None, base_url=API_URL, corpus=None):
+        self.api_token = api_token
+        self.cache = cache
+        # Every battle log read is also kept, deduplicated, in the local battle corpus
+        self.corpus = corpus
+        self.workers = workers
+        self.rate = rate
+        self.base_url = base_url
+        self.max_retries = max_retries
+        # Rate limits are per key, so each token gets its own bucket
+        self.keys = [APIKey(t, rate) for t in parse_tokens(api_token)]
+        self.keys_lock = threading.Lock()
+        # One keep-alive pool shared by every worker thread; urllib3 pools are
+        # thread-safe and pool_block keeps it from opening more than `workers` sockets.
+        self.session = requests.Session()
+        self.session.headers.update({"Accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @property
+    def throttled(self):
+        return sum(k.throttled for k in self.keys)
+
+    def pick_key(self):
+        # Least-loaded: the key whose bucket frees up first, then the fewest requests in flight
+        with self.keys_lock:
+            live = [k for k in self.keys if not k.revoked]
+            if not live:
+                raise NoValidKey("aucune clé API valide")
+            key = min(live, key=lambda k: (k.limiter.ready_in(), k.in_flight))
+            key.in_flight += 1
+            key.requests += 1
+            return key
+
+    def release_key(self, key):
+        with self.keys_lock:
+            key.in_flight -= 1
+
+    def backoff(self, key, status, headers, attempt):
+        """Record a failed attempt on `key` and return how long to sleep before retrying."""
+        if status == 403:
+            # accessDenied: revoked key or IP not whitelisted, park it for good
+            key.revoked = True
+            return 0.0
+        delay = retry_delay(headers, attempt)
+        if status == 429:
+            # Park only this key; the next attempt moves on to another one
+            key.throttled += 1
+            key.limiter.pause(delay)
+            return 0.0
+        return delay
+
+    def _get(self, path, headers=None):
+        """GET with rate limiting; retries 429/5xx and network errors, honoring Retry-After."""
+        attempt = 0
+        while True:
+            key = self.pick_key()
+            try:
+                key.limiter.acquire()
+                r = self.session.get(f"{self.base_url}{path}", headers={**key.headers, **(headers or {})}, timeout=10)
+            except requests.RequestException:
+                r = None
+            finally:
+                self.release_key(key)
+            status = r.status_code if r is not None else None
+            if status is not None and status != 403 and status not in RETRY_STATUS:
+                return r
+            if status != 403 and attempt == self.max_retries:
+                raise APIUnavailable(path)
+            time.sleep(self.backoff(key, status, r.headers if r is not None else {}, attempt))
+            if status != 403:
+                attempt += 1
+
+    def _fetch(self, kind, path):
+        """JSON body of a 200 response, served from the cache while it is fresh.
+
+        Stale entries are revalidated with If-None-Match / If-Modified-Since,
+        so an unchanged resource costs a 304 and no parsing.
+        """
+        return self._fetch_timed(kind, path)[0]
+
+    def _fetch_timed(self, kind, path):
+        # (data, when the API last sent it): a fresh cache hit is as old as its entry
+        if not self.cache:
+            r = self._get(path)
+            return (r.json() if r.status_code == 200 else None), time.time()
+        entry = self.cache.lookup(kind, path)
+        if entry and entry.fresh:
+            return self.cache.load(entry), entry.fetched_at
+        r = self._get(path, self.cache.validators(entry))
+        return self.cache.store(kind, path, entry, r.status_code, r.headers, r.json), time.time()
+
+    def get_battle_log(self, tag):
+        try:
+            battles, fetched = self._fetch_timed("battlelog", f"/players/{tag.replace('#', '%23')}/battlelog")
+        except APIUnavailable:
+            raise
+        except:
+            return []
+        battles = battles or []
+        if self.corpus is not None:
+            self.corpus.add(tag, battles, fetched)
+        return battles
+
+    def get_player(self, tag):
+        try:
+            return self._fetch("player", f"/players/{tag.replace('#', '%23')}")
+        except APIUnavailable:
+            raise
+        except:
+            return None
+
+    def get_clan(self, tag):
+        try:
+            return self._fetch("clan", f"/clans/{tag.replace('#', '%23')}")
+        except APIUnavailable:
+            raise
+        except:
+            return None
+
+    def battle_logs(self, tags):
+        """Yield (tag, battles) as each log arrives, `workers` requests in flight at once.
+
+        Requests still go through the per-key rate limiters; a log that stays
+        unavailable after the retries comes back as []. NoValidKey is raised:
+        with every key revoked, all the logs would otherwise look empty.
+        """
+        def fetch(tag):
+            try:
+                return self.get_battle_log(tag)
+            except NoValidKey:
+                raise
+            except APIUnavailable:
+                return []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(fetch, tag): tag for tag in tags}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                # Stopped early (error or consumer gone): don't fetch the rest
+                for future in futures:
+                    future.cancel()
+
+    def connection_stats(self):
+        """Connections opened vs. reused by the keep-alive pools.
+
+        Summed over the pools the adapter already holds: their keys carry the
+        adapter's pool_kwargs, so looking one up by URL would create a new, empty pool.
+        """
+        pools = self.session.get_adapter(self.base_url).poolmanager.pools
+        requests_made = opened = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_made += pool.num_requests
+                opened += pool.num_connections
+        return {
+            "requests": requests_made,
+            "opened": opened,
+            "reused": max(0, requests_made - opened),
+        }
+
+    def key_stats(self):
+        return [{
+            "key": f"…{k.token[-6:]}",
+            "requests": k.requests,
+            "throttled": k.throttled,
+            "revoked": k.revoked,
+        } for k in self.keys]
+
+    def close(self):
+        self.session.close()
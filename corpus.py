@@ -0,0 +1,257 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from calendar import timegm
+from datetime import datetime, timezone
+from cache import DEFAULT_TTL
+from cards import CATALOG
+from paths import data_path
+from tagset import encode_tag, decode_tag
+
+CORPUS_DB = data_path("battle_corpus.sqlite")
+
+
+def battle_key(battle):
+    """Same 63-bit id for a battle whichever player's log it was read from:
+    battle time plus the sorted tags of everyone in it."""
+    tags = sorted(p.get('tag', '') for side in ('team', 'opponent') for p in battle.get(side, []))
+    digest = hashlib.blake2b("|".join([battle.get('battleTime', ''), *tags]).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+
+def parse_battle_time(battle_time):
+    # Format: 20231222T153500.000Z, sliced by hand: strptime is most of the cost of loading a log
+    try:
+        b = battle_time
+        return timegm((int(b[0:4]), int(b[4:6]), int(b[6:8]), int(b[9:11]), int(b[11:13]), int(b[13:15]), 0, 0, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def format_battle_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y%m%dT%H%M%S.000Z")
+
+
+class BattleCorpus:
+    """Every battle log fetched, stored once per battle in SQLite.
+
+    A battle shows up in the log of each player in it; it is keyed on
+    `battle_key`, so reading it again from another log (or from the cache)
+    adds nothing. Decks are interned: a participant row is a handful of
+    integers (tag as its 64-bit encoding, side, crowns, trophies, deck id),
+    which keeps a battle around 130 bytes on disk against ~2.4 KB of JSON
+    per log entry. A deck is stored as the CardCatalog's DECK_SIZE bytes,
+    and the `cards` table is that catalog's names in id order: opening the
+    corpus seeds the catalog from it, so analytics read decks as they are.
+
+    Logs are queued by `add` and written in batches like HistoryStore;
+    `battle_logs` rebuilds API-shaped logs from the point of view of any
+    stored player so the analysis code reads them like fresh ones. The
+    `logs` table records whose own log was fetched and when: only those
+    players, within `max_age`, can stand in for an API call. Someone seen
+    only as an opponent has a few battles here, not their log.
+    """
+
+    def __init__(self, path=CORPUS_DB, batch_size=50, interval=2.0, max_age=DEFAULT_TTL["battlelog"], catalog=CATALOG):
+        self.path = path
+        self.catalog = catalog
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS cards (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+            CREATE TABLE IF NOT EXISTS modes (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+            CREATE TABLE IF NOT EXISTS decks (id INTEGER PRIMARY KEY, cards BLOB UNIQUE NOT NULL);
+            CREATE TABLE IF NOT EXISTS battles (
+                id INTEGER PRIMARY KEY,
+                time INTEGER NOT NULL,
+                mode INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS participants (
+                tag INTEGER NOT NULL,
+                battle INTEGER NOT NULL,
+                side INTEGER NOT NULL,
+                crowns INTEGER,
+                trophies INTEGER,
+                deck INTEGER,
+                PRIMARY KEY (tag, battle)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS participants_battle ON participants (battle);
+            CREATE TABLE IF NOT EXISTS logs (tag INTEGER PRIMARY KEY, fetched REAL NOT NULL);
+        """)
+        self.db.commit()
+        self.catalog.seed(name for name, in self.db.execute("SELECT name FROM cards ORDER BY id"))
+        self.stored_cards = self.db.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+        self.mode_ids = dict(self.db.execute("SELECT name, id FROM modes"))
+        self.mode_names = {i: name for name, i in self.mode_ids.items()}
+        self.deck_ids = dict(self.db.execute("SELECT cards, id FROM decks"))
+        self.deck_cards = {i: cards for cards, i in self.deck_ids.items()}
+
+    # --- INTERNING (called with the lock held) ---
+    def _intern(self, table, ids, names, value):
+        i = ids.get(value)
+        if i is None:
+            i = self.db.execute(f"INSERT INTO {table} VALUES (NULL, ?)", (value,)).lastrowid
+            ids[value] = i
+            names[i] = value
+        return i
+
+    def _deck(self, cards):
+        return self._intern("decks", self.deck_ids, self.deck_cards, self.catalog.deck(cards))
+
+    def _store_cards(self):
+        # Catalog ids only ever grow, so the table stays a prefix of it
+        names = self.catalog.names[self.stored_cards:]
+        self.db.executemany("INSERT INTO cards VALUES (?, ?)", enumerate(names, self.stored_cards))
+        self.stored_cards += len(names)
+
+    # --- WRITES ---
+    def add(self, tag, battles, fetched=None):
+        """Queue one player's battle log, as the API sent it at `fetched` (default now); written with the next batch."""
+        with self.lock:
+            self.pending.append((tag, battles, time.time() if fetched is None else fetched))
+            due = len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending:
+                return
+            with self.db:
+                # A log read again from the response cache must not look newer than it is
+                self.db.executemany("INSERT INTO logs VALUES (?, ?) ON CONFLICT (tag) DO UPDATE SET fetched = MAX(fetched, excluded.fetched)",
+                                    [(encode_tag(tag), fetched) for tag, _, fetched in self.pending if encode_tag(tag) is not None])
+                for _, battles, _ in self.pending:
+                    for b in battles:
+                        key = battle_key(b)
+                        inserted = self.db.execute(
+                            "INSERT OR IGNORE INTO battles VALUES (?, ?, ?)",
+                            (key, parse_battle_time(b.get('battleTime')),
+                             self._intern("modes", self.mode_ids, self.mode_names, b.get('gameMode', {}).get('name') or b.get('type', ''))),
+                        ).rowcount
+                        if not inserted:
+                            continue
+                        self.db.executemany(
+                            "INSERT OR IGNORE INTO participants VALUES (?, ?, ?, ?, ?, ?)",
+                            [(encode_tag(p.get('tag', '')) or 0, key, side, p.get('crowns', 0), p.get('startingTrophies'), self._deck(p.get('cards', [])))
+                             for side, name in enumerate(('team', 'opponent')) for p in b.get(name, [])],
+                        )
+                self._store_cards()
+            self.pending = []
+
+    # --- READS ---
+    def __len__(self):
+        self.flush()
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM battles").fetchone()[0]
+
+    def known(self, tags):
+        """How many stored battles each of `tags` played."""
+        self.flush()
+        keys = {encode_tag(t): t for t in tags}
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT tag, COUNT(*) FROM participants WHERE tag IN ({','.join('?' * len(keys))}) GROUP BY tag",
+                list(keys),
+            ).fetchall() if keys else []
+        return {keys[k]: n for k, n in rows}
+
+    def fresh(self, tags, max_age=None):
+        """The subset of `tags` whose own battle log was fetched less than `max_age` seconds ago."""
+        self.flush()
+        keys = {encode_tag(t): t for t in tags}
+        keys.pop(None, None)
+        since = time.time() - (self.max_age if max_age is None else max_age)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT tag FROM logs WHERE fetched >= ? AND tag IN ({','.join('?' * len(keys))})",
+                [since, *keys],
+            ).fetchall() if keys else []
+        return {keys[k] for k, in rows}
+
+    def rows(self, tags=None, limit=25):
+        """Yield (tag, rows) with one row per participant of each stored battle,
+        (battle, time, mode, my_side, participant tag, side, crowns, trophies, deck),
+        newest battle first. `limit` battles per tag; with tags=None every battle
+        once, seen from side 0 (tag is then None)."""
+        self.flush()
+        if tags is None:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT b.id, b.time, b.mode, 0, p.tag, p.side, p.crowns, p.trophies, p.deck"
+                    " FROM battles b JOIN participants p ON p.battle = b.id ORDER BY b.time DESC, b.id, p.side"
+                ).fetchall()
+            yield None, rows
+            return
+        for tag in tags:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT b.id, b.time, b.mode, me.side, p.tag, p.side, p.crowns, p.trophies, p.deck"
+                    " FROM (SELECT m.battle, m.side FROM participants m JOIN battles t ON t.id = m.battle"
+                    "       WHERE m.tag = ? ORDER BY t.time DESC LIMIT ?) me"
+                    " JOIN battles b ON b.id = me.battle"
+                    " JOIN participants p ON p.battle = me.battle"
+                    " ORDER BY b.time DESC, b.id",
+                    (encode_tag(tag), limit),
+                ).fetchall()
+            if rows:
+                yield tag, rows
+
+    def deck(self, deck_id):
+        """The catalog deck (DECK_SIZE bytes) behind a stored deck id."""
+        return self.deck_cards[deck_id]
+
+    def deck_names(self, deck_id):
+        return self.catalog.deck_names(self.deck_cards.get(deck_id, b""))
+
+    def battle_logs(self, tags, limit=25):
+        """Yield (tag, battle log) rebuilt from the store, newest first, for each of `tags`
+        with at least one stored battle. Only the fields the analysis reads are filled in."""
+        for tag, rows in self.rows(tags, limit):
+            battles, current = [], None
+            for battle, seconds, mode, my_side, ptag, side, crowns, trophies, deck in rows:
+                if battle != current:
+                    current = battle
+                    entry = {"battleTime": format_battle_time(seconds), "gameMode": {"name": self.mode_names.get(mode)},
+                             "team": [], "opponent": []}
+                    battles.append(entry)
+                entry["team" if side == my_side else "opponent"].append({
+                    "tag": decode_tag(ptag), "crowns": crowns, "startingTrophies": trophies,
+                    "cards": [{"name": name} for name in self.deck_names(deck)],
+                })
+            yield tag, battles
+
+    def stats(self):
+        self.flush()
+        with self.lock:
+            battles = self.db.execute("SELECT COUNT(*) FROM battles").fetchone()[0]
+            participants = self.db.execute("SELECT COUNT(*) FROM participants").fetchone()[0]
+            size = self.db.execute("SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()").fetchone()[0]
+        return {"battles": battles, "participants": participants, "decks": len(self.deck_ids), "cards": self.stored_cards,
+                "bytes": size, "bytes_per_battle": size / battles if battles else 0.0}
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+
+def battle_logs(api, corpus, tags, refresh=False):
+    """Yield (tag, battle log) for each of `tags`: from the corpus when that
+    player's own log was fetched within its max_age, from the API otherwise
+    (or for all with `refresh`). Logs fetched here go through the client, so
+    they land in the corpus too."""
+    tags = list(tags)
+    fresh = set() if refresh else corpus.fresh(tags)
+    if fresh:
+        yield from corpus.battle_logs([t for t in tags if t in fresh])
+    yield from api.battle_logs([t for t in tags if t not in fresh])
@@ -0,0 +1,336 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from clash_api import APIUnavailable, NoValidKey
+from tagset import TagSet
+from frontier import PriorityFrontier, PRIOR_HIT_RATE
+
+MAX_REQUEUE = 3
+# Neighbours checked before a node's own hit rate outweighs the prior
+HIT_RATE_SMOOTHING = 5
+# Neighbours in the trophy band a node needs before its yield is trusted enough to prune
+PRUNE_AFTER = 6
+
+
+def format_battle_date(battle_time):
+    # Format: 20231222T153500.000Z -> 2023-12-22
+    if not battle_time:
+        return "N/A"
+    return f"{battle_time[0:4]}-{battle_time[4:6]}-{battle_time[6:8]}"
+
+
+class Crawler:
+    """Snowball crawl over battle logs with a single long-lived worker pool.
+
+    Battle-log expansions and profile lookups share the same pool, so the
+    next frontier node is fetched while the current candidates are still
+    being checked instead of waiting for the whole batch.
+    """
+
+    def __init__(self, api, seed_tag, min_trophies, max_trophies, min_scan, objectif, workers=5, skip=None, checkpoint=None, visited=None, frontier=None, min_yield=0.0):
+        self.api = api
+        self.seed_tag = seed_tag
+        self.min_trophies = min_trophies
+        self.max_trophies = max_trophies
+        self.min_scan = min_scan
+        self.objectif = objectif
+        self.workers = workers
+        self.skip = skip if skip is not None else set()
+        self.checkpoint = checkpoint
+        # Skip nodes whose parent's recruits / neighbours in the band fell below this (0 = never prune)
+        self.min_yield = min_yield
+
+        # Nodes waiting to be expanded; a FifoFrontier gives the old breadth-first order
+        self.queue = frontier if frontier is not None else PriorityFrontier(min_trophies, max_trophies)
+        self.queue.push(seed_tag)
+        # Packed 64-bit tags by default; pass a tagset.BloomFilter to cap memory on huge crawls
+        self.visited = visited if visited is not None else TagSet()
+        self.visited.add(seed_tag)
+        # Tags visited since the last checkpoint, appended to its log on the next save
+        self.new_visited = [seed_tag]
+        self.candidates = deque()
+        # Candidate -> (node whose battle log it came from, time of that battle)
+        self.discovered = {}
+        # Expanded node -> [neighbours checked, of which in the trophy band, recruits]
+        self.yields = {}
+        # Queued node -> the node it was discovered from
+        self.parents = {}
+        # Nodes and candidates skipped for low yield, only used if the rest of the frontier runs dry
+        self.pruned = deque()
+        self.pruned_candidates = deque()
+        self.revived = 0
+        self.requests = 0
+        # Recruits waiting for their own battle log (last activity) before being reported
+        self.awaiting = {}
+        self.recruit_logs = deque()
+        self.found = []
+        self.scanned = 0
+        self.failures = {}
+        self.error = None
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def is_recruit(self, player):
+        trophies = player.get("trophies", 0)
+        return "clan" not in player and self.min_trophies <= trophies <= self.max_trophies
+
+    def make_row(self, tag, player, player_battles):
+        last_battle = "N/A"
+        if player_battles:
+            last_battle = format_battle_date(player_battles[0].get("battleTime", ""))
+        return {
+            "Nom": player["name"],
+            "Trophées": player.get("trophies", 0),
+            "Best": player.get("bestTrophies", 0),
+            "Carte Fav": player.get("currentFavouriteCard", {}).get("name", "N/A"),
+            "Dernière Partie": last_battle,
+            "Tag": tag,
+        }
+
+    def add_recruit(self, tag, player, player_battles):
+        row = self.make_row(tag, player, player_battles)
+        self.found.append(row)
+        return ("found", row)
+
+    def expand(self, node, battles):
+        for battle in battles:
+            for opp in battle.get('opponent', []):
+                tag = opp.get('tag')
+                if tag and tag not in self.visited:
+                    self.visited.add(tag)
+                    self.new_visited.append(tag)
+                    self.candidates.append(tag)
+                    self.discovered[tag] = (node, battle.get("battleTime"))
+
+    def hit_rate(self, node):
+        checked, _, recruits = self.yields.get(node, (0, 0, 0))
+        return (recruits + PRIOR_HIT_RATE * HIT_RATE_SMOOTHING) / (checked + HIT_RATE_SMOOTHING)
+
+    def low_yield(self, node):
+        # Judged on neighbours inside the band only: nodes on the way to the band
+        # find no recruits yet, but that says nothing about the region itself
+        _, in_band, recruits = self.yields.get(node, (0, 0, 0))
+        return node is not None and in_band >= PRUNE_AFTER and recruits < self.min_yield * in_band
+
+    def summary(self):
+        """Requests spent per recruit, and how many nodes pruning skipped.
+
+        What pruning saves is not reported: a skipped node may never have
+        been reached before the objectif, and the requests spent elsewhere
+        instead are unknown. `python bench.py pruning` measures it against
+        a crawl without pruning.
+        """
+        recruits = len(self.found)
+        return {
+            "requests": self.requests,
+            "recruits": recruits,
+            "requests_per_recruit": self.requests / recruits if recruits else None,
+            "pruned": len(self.pruned) + len(self.pruned_candidates),
+            "revived": self.revived,
+        }
+
+    def requeue(self, kind, tag):
+        # Throttled past every retry: put the tag back instead of losing that part of the frontier
+        self.failures[tag] = self.failures.get(tag, 0) + 1
+        if self.failures[tag] > MAX_REQUEUE:
+            return
+        if kind == "battlelog":
+            self.queue.push(tag)
+        else:
+            self.candidates.append(tag)
+
+    def filters(self):
+        return {"seed": self.seed_tag, "min_trophies": self.min_trophies,
+                "max_trophies": self.max_trophies, "min_scan": self.min_scan}
+
+    def restore(self):
+        """Resume from the checkpoint if it matches these filters; returns ("restored", row) events."""
+        if not self.checkpoint:
+            return []
+        self.checkpoint.bind(self.filters())
+        if not self.checkpoint.load(self):
+            # Nothing usable here; a checkpoint saved with other filters is left alone
+            if self.checkpoint.matches(self.filters()):
+                self.checkpoint.clear()
+            return []
+        return [("restored", row) for row in self.found]
+
+    def save_checkpoint(self, pending):
+        if self.checkpoint and self.checkpoint.due():
+            self.checkpoint.save(self, pending)
+
+    def close_checkpoint(self, pending, completed):
+        # A finished crawl has nothing to resume; a stopped or failed one keeps its state
+        if not self.checkpoint or self.checkpoint.path is None:
+            return
+        if completed:
+            self.checkpoint.clear()
+        else:
+            self.checkpoint.save(self, pending)
+        self.checkpoint.release()
+
+    def done(self):
+        """No new lookups needed: stopped, or enough recruits found or on their way."""
+        return not self.running or len(self.found) + len(self.awaiting) >= self.objectif
+
+    def finished(self):
+        return not self.running or (self.done() and not self.awaiting)
+
+    def next_node(self):
+        while self.queue:
+            tag = self.queue.pop()
+            if not self.low_yield(self.parents.pop(tag, None)):
+                return tag
+            # Its parent's other neighbours turned out poor since it was queued
+            self.pruned.append(tag)
+        return None
+
+    def next_candidate(self):
+        while self.candidates:
+            tag = self.candidates.popleft()
+            if not self.low_yield(self.discovered.get(tag, (None, None))[0]):
+                return tag
+            self.pruned_candidates.append(tag)
+        return None
+
+    def revive(self):
+        """Nothing better left: fall back on what was pruned rather than ending the crawl."""
+        if self.pruned_candidates:
+            for tag in self.pruned_candidates:
+                self.discovered[tag] = (None, self.discovered.get(tag, (None, None))[1])
+            self.revived += len(self.pruned_candidates)
+            self.candidates.extend(self.pruned_candidates)
+            self.pruned_candidates.clear()
+            return True
+        if self.pruned:
+            self.revived += len(self.pruned)
+            self.queue.extend(self.pruned)
+            self.pruned.clear()
+            return True
+        return False
+
+    def schedule(self, pending, expanding, in_flight, max_expanding):
+        """Next (kind, tag) requests to start, given how many are already in flight."""
+        # Recruit battle logs go first and are never held back: they are few and gate results
+        jobs = [("recruit", self.recruit_logs.popleft()) for _ in range(len(self.recruit_logs))]
+        pending += len(jobs)
+        if self.done():
+            return jobs
+        jobs += self.next_jobs(pending, expanding, in_flight, max_expanding)
+        if not jobs and not pending and self.revive():
+            jobs += self.next_jobs(pending, expanding, in_flight, max_expanding)
+        return jobs
+
+    def next_jobs(self, pending, expanding, in_flight, max_expanding):
+        jobs = []
+        # Keep expansions ahead of the lookups so candidates never run dry
+        while expanding < max_expanding and len(self.candidates) < in_flight:
+            tag = self.next_node()
+            if tag is None:
+                break
+            jobs.append(("battlelog", tag))
+            expanding += 1
+            pending += 1
+        while pending < in_flight:
+            tag = self.next_candidate()
+            if tag is None:
+                break
+            jobs.append(("player", tag))
+            pending += 1
+        return jobs
+
+    def handle(self, kind, tag, result):
+        """Apply one finished request. `result` returns the response or raises.
+
+        Returns the events it produced.
+        """
+        self.requests += 1
+        try:
+            result = result()
+        except NoValidKey as e:
+            self.error = str(e)
+            self.stop()
+            return []
+        except APIUnavailable:
+            if kind != "recruit":
+                self.requeue(kind, tag)
+                return []
+            # Report the recruit anyway, just without a last battle
+            result = None
+        except Exception:
+            result = None
+
+        if kind == "battlelog":
+            self.expand(tag, result or [])
+            return []
+
+        if kind == "recruit":
+            # One request gives both the last activity and the expansion of this node
+            player = self.awaiting.pop(tag)
+            if player.get("trophies", 0) >= self.min_scan:
+                self.expand(tag, result or [])
+            return [self.add_recruit(tag, player, result)]
+
+        self.scanned += 1
+        parent, battle_time = self.discovered.pop(tag, (None, None))
+        node_yield = self.yields.setdefault(parent, [0, 0, 0])
+        node_yield[0] += 1
+        events = []
+        if result:
+            if self.min_trophies <= result.get("trophies", 0) <= self.max_trophies:
+                node_yield[1] += 1
+            if self.is_recruit(result) and tag not in self.skip and not self.done():
+                node_yield[2] += 1
+                self.awaiting[tag] = result
+                self.recruit_logs.append(tag)
+            elif result.get("trophies", 0) >= self.min_scan:
+                if self.low_yield(parent):
+                    self.pruned.append(tag)
+                else:
+                    self.parents[tag] = parent
+                    self.queue.push(tag, trophies=result.get("trophies", 0), last_battle=battle_time,
+                                    hit_rate=self.hit_rate(parent))
+        events.append(("scanned", tag))
+        return events
+
+    def run(self):
+        """Yield ("scanned", tag) for every profile checked and ("found", row) for every recruit.
+
+        When resuming from a checkpoint, rows found by the previous run come first as ("restored", row).
+        """
+        self.running = True
+        in_flight = self.workers * 2
+        max_expanding = max(1, self.workers // 4)
+        expanding = 0
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        fetch = {"battlelog": self.api.get_battle_log, "recruit": self.api.get_battle_log, "player": self.api.get_player}
+        completed = False
+        try:
+            yield from self.restore()
+            while not self.finished():
+                for kind, tag in self.schedule(len(pending), expanding, in_flight, max_expanding):
+                    pending[executor.submit(fetch[kind], tag)] = (kind, tag)
+                    if kind == "battlelog":
+                        expanding += 1
+
+                if not pending:
+                    completed = True
+                    break
+
+                finished_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished_futures:
+                    kind, tag = pending.pop(future)
+                    if kind == "battlelog":
+                        expanding -= 1
+                    yield from self.handle(kind, tag, future.result)
+                    if self.finished():
+                        break
+                self.save_checkpoint(pending.values())
+            else:
+                completed = self.running
+        finally:
+            self.running = False
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.close_checkpoint(pending.values(), completed)
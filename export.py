@@ -0,0 +1,141 @@
+import csv
+import importlib.util
+import os
+import time
+from datetime import datetime
+from paths import data_path
+
+EXPORT_DIR = data_path("exports")
+# Parquet is only offered where pyarrow is installed
+FORMATS = ("csv", "parquet") if importlib.util.find_spec("pyarrow") else ("csv",)
+
+
+def export_path(name, fmt="csv", directory=EXPORT_DIR):
+    """<EXPORT_DIR>/<name>_<date>.<fmt>: one file per export, so a new scan never mixes with an old one."""
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}_{datetime.now():%Y%m%d-%H%M%S}.{fmt}")
+
+
+class CsvExport:
+    """Rows appended to a CSV file as they come instead of written all at once at the end.
+
+    The file is opened for append and the header only written when it is
+    empty, so nothing but the current row is ever held in memory and a
+    second run on the same path adds to it. Writes are flushed every
+    `interval` seconds; a crash loses at most that much.
+    """
+
+    def __init__(self, path, columns, interval=1.0):
+        self.path = path
+        self.columns = tuple(columns)
+        self.interval = interval
+        self.count = 0
+        self.last_flush = time.monotonic()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.columns, extrasaction="ignore")
+        if new:
+            self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.count += 1
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def coerce(kind, value):
+    # A value of another type than its column: converted when it can be ("9100" -> 9100, 5 -> "5"), left empty otherwise
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ParquetExport:
+    """Rows buffered column by column and written as one Parquet row group every `batch_size` rows.
+
+    Memory stays at one batch whatever the number of rows, and the file is
+    columnar and compressed, which suits large crawls better than CSV.
+    Parquet cannot be appended to once closed, so every export is a new
+    file. Needs pyarrow.
+
+    The schema is fixed up front rather than guessed from the first batch:
+    `types` maps columns to int, float or bool, every other column is text,
+    and values of another type are converted with `coerce`.
+    """
+
+    def __init__(self, path, columns, types=None, batch_size=10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow n'est pas installé: export Parquet indisponible")
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.columns = tuple(columns)
+        self.types = {name: (types or {}).get(name, str) for name in self.columns}
+        arrow_types = {int: pa.int64(), float: pa.float64(), bool: pa.bool_(), str: pa.string()}
+        self.schema = pa.schema([pa.field(name, arrow_types[self.types[name]]) for name in self.columns])
+        self.batch_size = batch_size
+        self.count = 0
+        self.pending = {name: [] for name in self.columns}
+        self.writer = None
+
+    def write(self, row):
+        for name, column in self.pending.items():
+            value, kind = row.get(name), self.types[name]
+            column.append(value if value is None or isinstance(value, kind) else coerce(kind, value))
+        self.count += 1
+        if len(self.pending[self.columns[0]]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending[self.columns[0]]:
+            return
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        table = self.pa.Table.from_pydict(self.pending, schema=self.schema)
+        self.writer.write_table(table)
+        self.pending = {name: [] for name in self.columns}
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_export(path, columns, types=None):
+    """CsvExport or ParquetExport depending on the extension of `path`; `types` only matters to Parquet."""
+    if path.endswith(".parquet"):
+        return ParquetExport(path, columns, types)
+    return CsvExport(path, columns)
+
+
+def write_rows(path, columns, rows, types=None):
+    """Stream an iterable of row dicts to `path`; returns the number of rows written."""
+    with open_export(path, columns, types) as export:
+        for row in rows:
+            export.write(row)
+    return export.count
@@ -1,85 +1,65 @@
 import flet as ft
-import requests
 import threading
-import json
-import os
 import time
-from collections import deque
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from clash_api import ClashAPI, APIUnavailable, NoValidKey
+from crawler import Crawler
+from async_crawler import AsyncCrawler
+from cache import ResponseCache
+from checkpoint import Checkpoint
+from history import HistoryStore
+from results import COLUMNS, COLUMN_TYPES, ResultBuffer, ResultPager
+from snapshots import ClanSnapshots, member_activity
+from analytics import BattleTable, top
+from corpus import BattleCorpus, battle_logs
+from export import EXPORT_DIR, FORMATS, export_path, open_export, write_rows
+from notifier import TelegramDispatcher
 
-# --- CONSTANTS ---
-HISTORY_FILE = "recruiter_history.json"
+# --- UI REFRESH ---
+class Refresher:
+    """Redraws the page on its own thread at most every `interval` seconds.
 
-# --- HISTORY MANAGEMENT ---
-def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r') as f:
-                return set(json.load(f))
-        except:
-            return set()
-    return set()
+    The scan thread only appends to buffers, so a slow websocket never holds
+    up the crawl. When a frame takes longer than `budget` of the interval,
+    the interval grows so the UI stays under that share of the time.
+    """
 
-def save_history(tags):
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(list(tags), f)
+    def __init__(self, draw, interval=0.25, budget=0.2):
+        self.draw = draw
+        self.base_interval = interval
+        self.interval = interval
+        self.budget = budget
+        self.frames = 0
+        self.draw_time = 0.0
+        self.worst = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
 
-def clear_history():
-    if os.path.exists(HISTORY_FILE):
-        os.remove(HISTORY_FILE)
+    def start(self):
+        self.thread.start()
+        return self
 
-# --- TELEGRAM ---
-def send_telegram(bot_token, chat_id, players):
-    if not bot_token or not chat_id:
-        return False
-    
-    message = "🎯 Nouvelles Recrues CR !\n━━━━━━━━━━━━━━━━━━\n\n"
-    for i, p in enumerate(players, 1):
-        clean_tag = p['Tag'].replace('#', '')
-        message += f"{i}. {p['Nom']}\n"
-        message += f"   🏆 {p['Trophées']} (Best: {p.get('Best', 'N/A')})\n"
-        message += f"   👤 https://royaleapi.com/player/{clean_tag}\n\n"
-    
-    if len(message) > 4000:
-        message = message[:4000] + "\n... (tronqué)"
-    
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    try:
-        r = requests.post(url, data={"chat_id": chat_id, "text": message, "disable_web_page_preview": True}, timeout=10)
-        return r.status_code == 200
-    except:
-        return False
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.frame()
 
-# --- API FUNCTIONS ---
-class ClashAPI:
-    def __init__(self, api_token):
-        self.api_token = api_token
-        self.headers = {"Authorization": f"Bearer {api_token}", "Accept": "application/json"}
-    
-    def get_battle_log(self, tag):
-        url = f"https://api.clashroyale.com/v1/players/{tag.replace('#', '%23')}/battlelog"
-        try:
-            r = requests.get(url, headers=self.headers, timeout=10)
-            return r.json() if r.status_code == 200 else []
-        except:
-            return []
-    
-    def get_player(self, tag):
-        url = f"https://api.clashroyale.com/v1/players/{tag.replace('#', '%23')}"
-        try:
-            r = requests.get(url, headers=self.headers, timeout=10)
-            return r.json() if r.status_code == 200 else None
-        except:
-            return None
-    
-    def get_clan(self, tag):
-        url = f"https://api.clashroyale.com/v1/clans/{tag.replace('#', '%23')}"
-        try:
-            r = requests.get(url, headers=self.headers, timeout=10)
-            return r.json() if r.status_code == 200 else None
-        except:
-            return None
+    def frame(self):
+        start = time.perf_counter()
+        self.draw()
+        elapsed = time.perf_counter() - start
+        self.frames += 1
+        self.draw_time += elapsed
+        self.worst = max(self.worst, elapsed)
+        self.interval = max(self.base_interval, elapsed / self.budget)
+
+    def stop(self):
+        """Stop the thread and draw one last frame with everything still buffered."""
+        self.stopped.set()
+        self.thread.join()
+        self.frame()
+
+    def stats(self):
+        return {"frames": self.frames, "avg_ms": self.draw_time / self.frames * 1000 if self.frames else 0.0, "worst_ms": self.worst * 1000}
 
 def main(page: ft.Page):
     page.title = "👑 CR Recruiter"
@@ -91,27 +71,44 @@ def main(page: ft.Page):
     
     # --- STATE ---
     api = None
+    cache = ResponseCache()
+    corpus = BattleCorpus()
+    crawler = None
     scanning = False
-    found_players = []
+    found_players = ResultBuffer()
+    pager = ResultPager(found_players, page_size=50)
     clan_members = []
-    history = load_history()
+    history = HistoryStore(expiry_days=30)
+    snapshots = ClanSnapshots()
+    # Telegram goes out from its own thread; the scan only queues batches
+    notifier = TelegramDispatcher().start()
     
     # --- CONFIG FIELDS ---
-    api_key_field = ft.TextField(label="Clé API Clash Royale", password=True, width=500)
+    api_key_field = ft.TextField(label="Clé(s) API Clash Royale (séparées par des virgules)", password=True, width=500)
     seed_tag_field = ft.TextField(label="Tag Graine", value="#989R2RPQ", width=150)
     min_trophies_field = ft.TextField(label="Min Trophées", value="7500", width=100)
     max_trophies_field = ft.TextField(label="Max Trophées", value="11000", width=100)
     min_scan_field = ft.TextField(label="Qualité Scan", value="7000", width=100)
     objectif_field = ft.TextField(label="Objectif", value="50", width=80)
+    min_yield_field = ft.TextField(label="Élagage (% recrues min)", value="0", width=160, tooltip="Ne plus explorer autour des joueurs dont les adversaires du palier ne donnent presque aucune recrue (0 = désactivé)")
     workers_field = ft.Slider(min=1, max=10, value=5, divisions=9, label="{value} workers", width=200)
+    rate_field = ft.TextField(label="Requêtes/s", value="20", width=100)
+    engine_field = ft.Dropdown(label="Moteur", value="threads", width=140, options=[ft.dropdown.Option("threads"), ft.dropdown.Option("asyncio")])
+    concurrency_field = ft.TextField(label="Requêtes en vol (asyncio)", value="100", width=180)
+    export_format_field = ft.Dropdown(label="Export", value="csv", width=120, options=[ft.dropdown.Option(f) for f in FORMATS],
+                                      tooltip=f"Les recrues sont écrites dans {EXPORT_DIR} au fur et à mesure du scan")
     
     # Telegram config
     telegram_token_field = ft.TextField(label="Telegram Bot Token", value="8532137772:AAGcnzo6D5rDleWEc0hPb-BdlS4lg1hrBF8", password=True, width=400)
     telegram_chat_id_field = ft.TextField(label="Telegram Chat ID", value="-1003643661262", width=200)
     telegram_batch_field = ft.TextField(label="Notifier tous les X", value="20", width=100)
     
+    # Resume toggle
+    resume_checkbox = ft.Checkbox(label="Reprendre le dernier scan interrompu", value=True)
+    
     # History toggle
     use_history_checkbox = ft.Checkbox(label=f"Ignorer joueurs déjà trouvés ({len(history)} en historique)", value=True)
+    expiry_field = ft.TextField(label="Re-proposer après (jours, 0 = jamais)", value="30", width=120)
     
     # Status & Progress
     status_text = ft.Text("En attente...", size=14)
@@ -133,20 +130,61 @@ def main(page: ft.Page):
         ],
         rows=[],
     )
+    page_text = ft.Text("Page 1/1")
+    results_lock = threading.Lock()
+    
+    def result_row(row):
+        return ft.DataRow(cells=[ft.DataCell(ft.Text(str(value))) for value in row])
+    
+    def render_results():
+        # Only the page on screen lives in the table, and only its new rows are sent
+        with results_lock:
+            change = pager.refresh()
+            if change:
+                mode, rows = change
+                if mode == "reset":
+                    results_table.rows.clear()
+                results_table.rows.extend(result_row(row) for row in rows)
+            page_text.value = f"Page {pager.page + 1}/{pager.pages()}"
+    
+    def show_page(delta):
+        pager.go(pager.page + delta)
+        render_results()
+        page.update()
+    
+    def get_api():
+        # Reuse the same keep-alive pool across scans, clan loads and analyses
+        nonlocal api
+        workers = int(workers_field.value)
+        rate = float(rate_field.value or 0)
+        if api is None or api.api_token != api_key_field.value or api.workers != workers or api.rate != rate:
+            if api:
+                api.close()
+            api = ClashAPI(api_key_field.value, workers=workers, rate=rate, cache=cache, corpus=corpus)
+        return api
     
     # --- SCAN LOGIC ---
     def run_scan(e):
-        nonlocal api, scanning, found_players, history
+        nonlocal crawler, scanning
         
         if not api_key_field.value:
             status_text.value = "⚠️ Entrez votre clé API"
             page.update()
             return
         
-        api = ClashAPI(api_key_field.value)
+        try:
+            # Written row by row as recruits come in, so the export never holds the whole scan
+            export = open_export(export_path("recrues", export_format_field.value), COLUMNS, COLUMN_TYPES)
+        except (ImportError, OSError) as error:
+            status_text.value = f"❌ Export impossible: {error}"
+            page.update()
+            return
+        
+        api = get_api()
         scanning = True
-        found_players = []
-        history = load_history()
+        found_players.clear()
+        pager.reset()
+        history.expiry_days = int(expiry_field.value or 0)
         use_hist = use_history_checkbox.value
         
         min_tr = int(min_trophies_field.value)
@@ -155,140 +193,115 @@ def main(page: ft.Page):
         objectif = int(objectif_field.value)
         workers = int(workers_field.value)
         tg_batch = int(telegram_batch_field.value)
+        min_yield = float(min_yield_field.value or 0) / 100
         
-        queue = deque([seed_tag_field.value])
-        visited = {seed_tag_field.value}
-        scanned = 0
+        checkpoint = Checkpoint("flet", resume=resume_checkbox.value)
+        if engine_field.value == "asyncio":
+            workers = int(concurrency_field.value)
+            crawler = AsyncCrawler(api, seed_tag_field.value, min_tr, max_tr, min_scan, objectif, workers,
+                                   skip=history if use_hist else set(), checkpoint=checkpoint, min_yield=min_yield)
+        else:
+            crawler = Crawler(api, seed_tag_field.value, min_tr, max_tr, min_scan, objectif, workers,
+                              skip=history if use_hist else set(), checkpoint=checkpoint, min_yield=min_yield)
         notif_count = 0
         last_notified = 0
         
         progress_bar.visible = True
         status_text.value = f"🔍 Recherche en cours avec {workers} workers..."
-        results_table.rows.clear()
+        render_results()
         page.update()
         
-        while queue and len(found_players) < objectif and scanning:
-            current = queue.popleft()
-            battles = api.get_battle_log(current)
-            
-            tags_to_check = []
-            for battle in battles:
-                for opp in battle.get('opponent', []):
-                    tag = opp['tag']
-                    if tag not in visited:
-                        visited.add(tag)
-                        tags_to_check.append(tag)
+        def draw():
+            render_results()
+            scanned_text.value = f"Scannés: {crawler.scanned}"
+            found_text.value = f"Trouvés: {len(found_players)}"
+            queue_text.value = f"File: {len(crawler.queue)}"
+            notif_text.value = f"Notifs: {notif_count}"
+            if scanning:
+                status_text.value = f"🔍 {crawler.scanned} profils... (file: {len(crawler.queue)})"
+            page.update()
+        
+        refresher = Refresher(draw).start()
+        scan_id = f"{datetime.now():%Y-%m-%d %H:%M} {seed_tag_field.value}"
+        try:
+            for kind, data in crawler.run():
+                if not scanning:
+                    crawler.stop()
+                    break
             
-            if tags_to_check and scanning:
-                with ThreadPoolExecutor(max_workers=workers) as executor:
-                    futures = {executor.submit(api.get_player, tag): tag for tag in tags_to_check}
-                    
-                    for future in as_completed(futures):
-                        if len(found_players) >= objectif or not scanning:
-                            break
-                        
-                        tag = futures[future]
-                        scanned += 1
-                        
-                        try:
-                            player = future.result()
-                            if player:
-                                trophies = player.get("trophies", 0)
-                                has_clan = "clan" in player
-                                
-                                if not has_clan and min_tr <= trophies <= max_tr:
-                                    if use_hist and tag in history:
-                                        continue
-                                    
-                                    clean_tag = tag.replace('#', '')
-                                    best = player.get("bestTrophies", 0)
-                                    fav_card = player.get("currentFavouriteCard", {}).get("name", "N/A")
-                                    
-                                    # Get last battle
-                                    player_battles = api.get_battle_log(tag)
-                                    last_battle = "N/A"
-                                    if player_battles:
-                                        bt = player_battles[0].get("battleTime", "")
-                                        if bt:
-                                            last_battle = f"{bt[0:4]}-{bt[4:6]}-{bt[6:8]}"
-                                    
-                                    found_players.append({
-                                        "Nom": player["name"],
-                                        "Trophées": trophies,
-                                        "Best": best,
-                                        "Carte Fav": fav_card,
-                                        "Dernière Partie": last_battle,
-                                        "Tag": tag,
-                                    })
-                                    
-                                    results_table.rows.append(
-                                        ft.DataRow(cells=[
-                                            ft.DataCell(ft.Text(player["name"])),
-                                            ft.DataCell(ft.Text(str(trophies))),
-                                            ft.DataCell(ft.Text(str(best))),
-                                            ft.DataCell(ft.Text(fav_card)),
-                                            ft.DataCell(ft.Text(last_battle)),
-                                            ft.DataCell(ft.Text(tag)),
-                                        ])
-                                    )
-                                    
-                                    # Telegram notification
-                                    if telegram_chat_id_field.value and len(found_players) >= last_notified + tg_batch:
-                                        players_to_send = found_players[last_notified:]
-                                        if send_telegram(telegram_token_field.value, telegram_chat_id_field.value, players_to_send):
-                                            notif_count += 1
-                                            last_notified = len(found_players)
-                                            notif_text.value = f"Notifs: {notif_count}"
-                                
-                                if trophies >= min_scan:
-                                    queue.append(tag)
-                        except:
-                            pass
-                        
-                        scanned_text.value = f"Scannés: {scanned}"
-                        found_text.value = f"Trouvés: {len(found_players)}"
-                        queue_text.value = f"File: {len(queue)}"
-                        status_text.value = f"🔍 {scanned} profils... (file: {len(queue)})"
-                        page.update()
+                if kind in ("found", "restored"):
+                    found_players.append(data)
+                    export.write(data)
+                    history.record(data, scan_id)
+                    if kind == "restored":
+                        last_notified = len(found_players)
+                        continue
+                
+                    # Telegram notification
+                    if telegram_chat_id_field.value and len(found_players) >= last_notified + tg_batch:
+                        players_to_send = found_players[last_notified:]
+                        history.flush()
+                        if notifier.send_players(telegram_token_field.value, telegram_chat_id_field.value, players_to_send):
+                            notif_count += 1
+                            last_notified = len(found_players)
+        finally:
+            history.flush()
+            export.close()
+            scanning = False
+            refresher.stop()
         
-        # Save history
         if found_players:
-            new_tags = {p['Tag'] for p in found_players}
-            save_history(history.union(new_tags))
-            use_history_checkbox.label = f"Ignorer joueurs déjà trouvés ({len(history) + len(found_players)} en historique)"
+            use_history_checkbox.label = f"Ignorer joueurs déjà trouvés ({len(history)} en historique)"
         
         # Send remaining
         if telegram_chat_id_field.value and len(found_players) > last_notified:
-            send_telegram(telegram_token_field.value, telegram_chat_id_field.value, found_players[last_notified:])
+            if notifier.send_players(telegram_token_field.value, telegram_chat_id_field.value, found_players[last_notified:]):
+                notif_count += 1
         
-        scanning = False
         progress_bar.visible = False
-        status_text.value = f"✅ Terminé ! {len(found_players)} recrues trouvées."
+        conn = api.connection_stats()
+        revoked = sum(1 for k in api.key_stats() if k["revoked"])
+        hits = cache.stats()
+        summary = crawler.summary()
+        status_text.value = f"✅ Terminé ! {len(found_players)} recrues trouvées. ({conn['opened']} connexions ouvertes, {conn['reused']} réutilisées, {len(api.keys) - revoked}/{len(api.keys)} clés actives, cache {hits['hit_rate']:.0%})"
+        if summary["requests_per_recruit"]:
+            status_text.value += f" · {summary['requests_per_recruit']:.1f} requêtes/recrue"
+        if summary["pruned"]:
+            status_text.value += f", {summary['pruned']} nœuds élagués"
+        frames = refresher.stats()
+        status_text.value += f" · UI {frames['frames']} rafraîchissements, {frames['avg_ms']:.0f} ms en moyenne (max {frames['worst_ms']:.0f} ms)"
+        if export.count:
+            status_text.value += f" · 📥 {export.path}"
+        telegram = notifier.stats()
+        if telegram["pending"] or telegram["failed"]:
+            status_text.value += f" · 📱 {telegram['pending']} envois Telegram en attente, {telegram['failed']} échoués"
+        if crawler.error:
+            status_text.value = f"❌ {crawler.error}"
         page.update()
     
     def stop_scan(e):
         nonlocal scanning
         scanning = False
+        if crawler:
+            crawler.stop()
         status_text.value = "⏹️ Scan arrêté"
         progress_bar.visible = False
         page.update()
     
     def clear_hist(e):
-        nonlocal history
-        clear_history()
-        history = set()
+        history.clear()
         use_history_checkbox.label = f"Ignorer joueurs déjà trouvés (0 en historique)"
         status_text.value = "🗑️ Historique vidé"
         page.update()
     
     def export_csv(e):
         if found_players:
-            import csv
-            with open("recrues_export.csv", "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=["Nom", "Trophées", "Best", "Carte Fav", "Dernière Partie", "Tag"])
-                writer.writeheader()
-                writer.writerows(found_players)
-            status_text.value = "📥 Exporté vers recrues_export.csv"
+            path = export_path("recrues", export_format_field.value)
+            try:
+                write_rows(path, COLUMNS, iter(found_players), COLUMN_TYPES)
+                status_text.value = f"📥 Exporté vers {path}"
+            except (ImportError, OSError) as error:
+                status_text.value = f"❌ Export impossible: {error}"
             page.update()
     
     # --- CLAN TAB ---
@@ -309,15 +322,28 @@ def main(page: ft.Page):
     clan_progress = ft.ProgressBar(visible=False, width=400)
     clan_analytics = ft.Column([], scroll=ft.ScrollMode.AUTO)
     
+    def clan_row(m):
+        return ft.DataRow(cells=[
+            ft.DataCell(ft.Text(m['Nom'])),
+            ft.DataCell(ft.Text(str(m['Trophées']))),
+            ft.DataCell(ft.Text(m['Rôle'])),
+            ft.DataCell(ft.Text(str(m['Dons']))),
+            ft.DataCell(ft.Text(m['Dernière Partie'])),
+            ft.DataCell(ft.Text(m['Statut'])),
+        ])
+    
     def load_clan(e):
-        nonlocal api, clan_members
+        nonlocal clan_members
         if not api_key_field.value:
             clan_status.value = "⚠️ Entrez votre clé API d'abord"
             page.update()
             return
         
-        api = ClashAPI(api_key_field.value)
-        clan_data = api.get_clan(clan_tag_field.value)
+        api = get_api()
+        try:
+            clan_data = api.get_clan(clan_tag_field.value)
+        except APIUnavailable:
+            clan_data = None
         
         if clan_data:
             clan_members = []
@@ -327,17 +353,19 @@ def main(page: ft.Page):
             page.update()
             
             members = clan_data.get('memberList', [])
-            for idx, m in enumerate(members):
-                role = m.get('role', '').replace('coLeader', 'Co-Leader').replace('elder', 'Aîné').replace('member', 'Membre').replace('leader', 'Chef')
+            rank = {m.get('tag', ''): i for i, m in enumerate(members)}
+            previous = snapshots.snapshots(clan_data.get('tag', ''))
+            last_battles = {}
+            try:
+                for idx, (m, bt) in enumerate(member_activity(api, snapshots, clan_data)):
+                    tag = m.get('tag', '')
+                    last_battles[tag] = bt
+                    role = m.get('role', '').replace('coLeader', 'Co-Leader').replace('elder', 'Aîné').replace('member', 'Membre').replace('leader', 'Chef')
                 
-                # Get activity
-                battles = api.get_battle_log(m.get('tag', ''))
-                status_emoji = "🔒"
-                last_battle = "Privé"
-                days_ago = 999
+                    status_emoji = "🔒"
+                    last_battle = "Privé"
+                    days_ago = 999
                 
-                if battles:
-                    bt = battles[0].get('battleTime', '')
                     if bt:
                         try:
                             b_date = datetime.strptime(bt[:15], '%Y%m%dT%H%M%S')
@@ -351,30 +379,30 @@ def main(page: ft.Page):
                         except:
                             pass
                 
-                clan_members.append({
-                    "Nom": m.get('name', ''),
-                    "Tag": m.get('tag', ''),
-                    "Trophées": m.get('trophies', 0),
-                    "Rôle": role,
-                    "Dons": m.get('donations', 0),
-                    "Dernière Partie": last_battle,
-                    "Statut": status_emoji,
-                })
-                
-                clan_table.rows.append(
-                    ft.DataRow(cells=[
-                        ft.DataCell(ft.Text(m.get('name', ''))),
-                        ft.DataCell(ft.Text(str(m.get('trophies', 0)))),
-                        ft.DataCell(ft.Text(role)),
-                        ft.DataCell(ft.Text(str(m.get('donations', 0)))),
-                        ft.DataCell(ft.Text(last_battle)),
-                        ft.DataCell(ft.Text(status_emoji)),
-                    ])
-                )
+                    clan_members.append({
+                        "Nom": m.get('name', ''),
+                        "Tag": tag,
+                        "Trophées": m.get('trophies', 0),
+                        "Rôle": role,
+                        "Dons": m.get('donations', 0),
+                        "Dernière Partie": last_battle,
+                        "Statut": status_emoji,
+                    })
+                    clan_table.rows.append(clan_row(clan_members[-1]))
                 
-                clan_status.value = f"Chargement... {idx+1}/{len(members)}"
+                    clan_status.value = f"Chargement... {idx+1}/{len(members)}"
+                    page.update()
+            except NoValidKey as error:
+                clan_progress.visible = False
+                clan_status.value = f"❌ {error}"
                 page.update()
-                time.sleep(0.05)
+                return
+            
+            # Back to the clan's ranking once everything is in
+            clan_members.sort(key=lambda m: rank[m['Tag']])
+            clan_table.rows = [clan_row(m) for m in clan_members]
+            snapshot = snapshots.save(clan_data, last_battles)
+            changes = snapshots.diff(previous[-1][0], snapshot) if previous else None
             
             # Stats
             total_trophies = sum(m['Trophées'] for m in clan_members)
@@ -476,29 +504,86 @@ def main(page: ft.Page):
             # Update player dropdown
             player_dropdown.options = [ft.dropdown.Option(f"{m['Nom']} ({m['Tag']})") for m in clan_members]
             
+            if changes:
+                since = datetime.fromtimestamp(previous[-1][1]).strftime('%Y-%m-%d %H:%M')
+                dons = sum(c['donations'] for c in changes['changed'])
+                clan_analytics.controls.insert(0, ft.Column([
+                    ft.Text(f"📜 Depuis le {since}", size=18, weight=ft.FontWeight.BOLD),
+                    ft.Text(f"➕ Arrivées: {', '.join(j['name'] for j in changes['joined']) or 'aucune'}"),
+                    ft.Text(f"➖ Départs: {', '.join(l['name'] for l in changes['left']) or 'aucun'}"),
+                    ft.Text(f"💝 +{dons} dons · " + ", ".join(f"{c['name']} +{c['donations']}" for c in changes['changed'][:5] if c['donations'] > 0)),
+                ]))
+            
             clan_progress.visible = False
-            clan_status.value = f"✅ {clan_data.get('name', '')} - {len(clan_members)} membres"
+            clan_status.value = f"✅ {clan_data.get('name', '')} - {len(clan_members)} membres ({len(snapshots.snapshots(clan_data.get('tag', '')))} chargements enregistrés)"
         else:
             clan_status.value = "❌ Impossible de charger le clan"
         page.update()
     
     def export_clan_csv(e):
         if clan_members:
-            import csv
-            with open("clan_members.csv", "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=["Nom", "Tag", "Trophées", "Rôle", "Dons", "Dernière Partie", "Statut"])
-                writer.writeheader()
-                writer.writerows(clan_members)
-            clan_status.value = "📥 Exporté vers clan_members.csv"
+            path = export_path("clan_members", export_format_field.value)
+            try:
+                write_rows(path, ["Nom", "Tag", "Trophées", "Rôle", "Dons", "Dernière Partie", "Statut"], clan_members, {"Trophées": int, "Dons": int})
+                clan_status.value = f"📥 Exporté vers {path}"
+            except (ImportError, OSError) as error:
+                clan_status.value = f"❌ Export impossible: {error}"
             page.update()
     
     # --- PLAYER ANALYSIS TAB ---
     player_dropdown = ft.Dropdown(label="Choisir un membre du clan", options=[], width=300)
     player_tag_field = ft.TextField(label="Ou entrer un Tag", value="#PL0Q8UGR", width=200)
     player_info = ft.Column([], scroll=ft.ScrollMode.AUTO)
+    refresh_battles_checkbox = ft.Checkbox(label="Actualiser les combats depuis l'API", value=False,
+                                           tooltip="Sinon les journaux récupérés il y a moins de 5 min sont relus depuis la base locale")
+    
+    def battle_summary(table, title):
+        record = table.record()
+        matchups = table.card_matchups(min_count=2)
+        card_line = lambda c: ft.Text(f"{c['card']}: {c['wins']}/{c['total']} ({c['win_rate']:.0f}%)")
+        return [
+            ft.Text(title, size=20, weight=ft.FontWeight.BOLD),
+            ft.Row([
+                ft.Container(ft.Column([ft.Text("✅"), ft.Text(str(record['wins']), size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.GREEN_900, padding=10, border_radius=10),
+                ft.Container(ft.Column([ft.Text("❌"), ft.Text(str(record['losses']), size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.RED_900, padding=10, border_radius=10),
+                ft.Container(ft.Column([ft.Text("🟰"), ft.Text(str(record['draws']), size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.GREY_800, padding=10, border_radius=10),
+                ft.Container(ft.Column([ft.Text("📈"), ft.Text(f"{record['win_rate']:.1f}%", size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.CYAN_900, padding=10, border_radius=10),
+            ], spacing=10),
+            # Card matchups
+            ft.Divider(),
+            ft.Text("🃏 Match-ups Cartes", size=20, weight=ft.FontWeight.BOLD),
+            ft.Row([
+                ft.Column([ft.Text("💪 Victimes", weight=ft.FontWeight.BOLD), *[card_line(c) for c in top(matchups, "win_rate", 5)]], width=300),
+                ft.Column([ft.Text("⚠️ Bourreaux", weight=ft.FontWeight.BOLD), *[card_line(c) for c in top(matchups, "win_rate", 5, ascending=True)]], width=300),
+            ], spacing=50),
+        ]
+    
+    def analyze_clan(e):
+        # Same analysis over every loaded member's battle log at once
+        if not api_key_field.value or not clan_members:
+            player_info.controls = [ft.Text("⚠️ Chargez d'abord un clan dans l'onglet Mon Clan")]
+            page.update()
+            return
+        api = get_api()
+        player_info.controls = [ft.Text(f"⏳ Chargement des combats de {len(clan_members)} membres...")]
+        page.update()
+        # Logs fetched within the last few minutes come from the corpus, the rest from the API
+        try:
+            table = BattleTable.from_logs(battle_logs(api, corpus, [m['Tag'] for m in clan_members], refresh_battles_checkbox.value))
+        except NoValidKey as error:
+            player_info.controls = [ft.Text(f"❌ {error}")]
+            page.update()
+            return
+        players = table.per_player()
+        names = {m['Tag']: m['Nom'] for m in clan_members}
+        player_info.controls = battle_summary(table, f"🏰 {len(table)} combats de {len(table.players)} membres") + [
+            ft.Divider(),
+            ft.Text("📈 Win rate par membre", size=20, weight=ft.FontWeight.BOLD),
+            *[ft.Text(f"{names.get(p['tag'], p['tag'])}: {p['wins']}/{p['battles']} ({p['win_rate']:.0f}%)") for p in top(players, "win_rate", 50)],
+        ]
+        page.update()
     
     def analyze_player(e):
-        nonlocal api
         if not api_key_field.value:
             player_info.controls = [ft.Text("⚠️ Entrez votre clé API d'abord")]
             page.update()
@@ -508,9 +593,18 @@ def main(page: ft.Page):
         if player_dropdown.value:
             tag = player_dropdown.value.split("(")[-1].replace(")", "").strip()
         
-        api = ClashAPI(api_key_field.value)
-        player = api.get_player(tag)
-        battles = api.get_battle_log(tag)
+        api = get_api()
+        try:
+            player = api.get_player(tag)
+            battles = dict(battle_logs(api, corpus, [tag], refresh_battles_checkbox.value)).get(tag, [])
+        except NoValidKey as error:
+            player_info.controls = [ft.Text(f"❌ {error}")]
+            page.update()
+            return
+        except APIUnavailable:
+            player_info.controls = [ft.Text("⏳ API saturée, réessayez dans un instant")]
+            page.update()
+            return
         
         if player:
             # Profile header
@@ -544,55 +638,7 @@ def main(page: ft.Page):
             
             # Battle log analysis
             if battles:
-                wins, losses, draws = 0, 0, 0
-                card_stats = {}
-                
-                for b in battles:
-                    tc = sum([p.get('crowns', 0) for p in b.get('team', [])])
-                    oc = sum([p.get('crowns', 0) for p in b.get('opponent', [])])
-                    outcome = "win" if tc > oc else ("loss" if tc < oc else "draw")
-                    if outcome == "win": wins += 1
-                    elif outcome == "loss": losses += 1
-                    else: draws += 1
-                    
-                    for opp in b.get('opponent', []):
-                        for card in opp.get('cards', []):
-                            name = card.get('name')
-                            if name not in card_stats:
-                                card_stats[name] = {'wins': 0, 'losses': 0, 'total': 0}
-                            card_stats[name]['total'] += 1
-                            if outcome == "win": card_stats[name]['wins'] += 1
-                            elif outcome == "loss": card_stats[name]['losses'] += 1
-                
-                recent_wr = (wins / (wins + losses + draws) * 100) if (wins + losses + draws) > 0 else 0
-                
-                player_info.controls.append(ft.Text(f"🕹️ Derniers {len(battles)} combats", size=20, weight=ft.FontWeight.BOLD))
-                player_info.controls.append(ft.Row([
-                    ft.Container(ft.Column([ft.Text("✅"), ft.Text(str(wins), size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.GREEN_900, padding=10, border_radius=10),
-                    ft.Container(ft.Column([ft.Text("❌"), ft.Text(str(losses), size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.RED_900, padding=10, border_radius=10),
-                    ft.Container(ft.Column([ft.Text("🟰"), ft.Text(str(draws), size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.GREY_800, padding=10, border_radius=10),
-                    ft.Container(ft.Column([ft.Text("📈"), ft.Text(f"{recent_wr:.1f}%", size=20, weight=ft.FontWeight.BOLD)], horizontal_alignment=ft.CrossAxisAlignment.CENTER), bgcolor=ft.Colors.CYAN_900, padding=10, border_radius=10),
-                ], spacing=10))
-                
-                # Card matchups
-                player_info.controls.append(ft.Divider())
-                player_info.controls.append(ft.Text("🃏 Match-ups Cartes", size=20, weight=ft.FontWeight.BOLD))
-                
-                sorted_cards = sorted(card_stats.items(), key=lambda x: x[1]['total'], reverse=True)
-                victims = sorted([c for c in sorted_cards if c[1]['total'] >= 2], key=lambda x: (x[1]['wins']/x[1]['total']), reverse=True)[:5]
-                executioners = sorted([c for c in sorted_cards if c[1]['total'] >= 2], key=lambda x: (x[1]['wins']/x[1]['total']))[:5]
-                
-                matchup_row = ft.Row([
-                    ft.Column([
-                        ft.Text("💪 Victimes", weight=ft.FontWeight.BOLD),
-                        *[ft.Text(f"{c[0]}: {c[1]['wins']}/{c[1]['total']} ({c[1]['wins']/c[1]['total']*100:.0f}%)") for c in victims]
-                    ], width=300),
-                    ft.Column([
-                        ft.Text("⚠️ Bourreaux", weight=ft.FontWeight.BOLD),
-                        *[ft.Text(f"{c[0]}: {c[1]['wins']}/{c[1]['total']} ({c[1]['wins']/c[1]['total']*100:.0f}%)") for c in executioners]
-                    ], width=300),
-                ], spacing=50)
-                player_info.controls.append(matchup_row)
+                player_info.controls += battle_summary(BattleTable.from_logs({tag: battles}), f"🕹️ Derniers {len(battles)} combats")
         else:
             player_info.controls = [ft.Text("❌ Joueur non trouvé")]
         page.update()
@@ -608,23 +654,29 @@ def main(page: ft.Page):
                         ft.Row([api_key_field]),
                         ft.Divider(),
                         ft.Text("🎯 Filtres", weight=ft.FontWeight.BOLD),
-                        ft.Row([seed_tag_field, min_trophies_field, max_trophies_field, min_scan_field, objectif_field]),
-                        ft.Row([ft.Text("Workers:"), workers_field]),
+                        ft.Row([seed_tag_field, min_trophies_field, max_trophies_field, min_scan_field, objectif_field, min_yield_field]),
+                        ft.Row([ft.Text("Workers:"), workers_field, rate_field, engine_field, concurrency_field]),
                         ft.Divider(),
                         ft.Text("📱 Telegram", weight=ft.FontWeight.BOLD),
                         ft.Row([telegram_token_field, telegram_chat_id_field, telegram_batch_field]),
                         ft.Divider(),
-                        ft.Row([use_history_checkbox, ft.ElevatedButton("🗑️ Vider historique", on_click=clear_hist)]),
+                        ft.Row([use_history_checkbox, expiry_field, ft.ElevatedButton("🗑️ Vider historique", on_click=clear_hist), resume_checkbox]),
                         ft.Divider(),
                         ft.Row([
                             ft.ElevatedButton("🚀 Lancer", on_click=lambda e: threading.Thread(target=run_scan, args=(e,)).start(), bgcolor=ft.Colors.GREEN),
                             ft.ElevatedButton("⏹️ Stop", on_click=stop_scan, bgcolor=ft.Colors.RED),
-                            ft.ElevatedButton("📥 Exporter CSV", on_click=export_csv),
+                            ft.ElevatedButton("📥 Exporter", on_click=export_csv),
+                            export_format_field,
                         ], spacing=10),
                         ft.Row([scanned_text, found_text, queue_text, notif_text], spacing=30),
                         progress_bar,
                         status_text,
                         ft.Container(content=results_table, height=350),
+                        ft.Row([
+                            ft.IconButton(ft.Icons.CHEVRON_LEFT, on_click=lambda e: show_page(-1)),
+                            page_text,
+                            ft.IconButton(ft.Icons.CHEVRON_RIGHT, on_click=lambda e: show_page(1)),
+                        ]),
                     ], spacing=10, scroll=ft.ScrollMode.AUTO),
                     padding=20,
                 ),
@@ -633,7 +685,7 @@ def main(page: ft.Page):
                 text="🏰 Mon Clan",
                 content=ft.Container(
                     content=ft.Column([
-                        ft.Row([clan_tag_field, ft.ElevatedButton("📊 Charger", on_click=lambda e: threading.Thread(target=load_clan, args=(e,)).start()), ft.ElevatedButton("📥 Export CSV", on_click=export_clan_csv)]),
+                        ft.Row([clan_tag_field, ft.ElevatedButton("📊 Charger", on_click=lambda e: threading.Thread(target=load_clan, args=(e,)).start()), ft.ElevatedButton("📥 Exporter", on_click=export_clan_csv)]),
                         clan_progress,
                         clan_status,
                         clan_stats,
@@ -650,7 +702,7 @@ def main(page: ft.Page):
                 text="🕹️ Analyse Joueur",
                 content=ft.Container(
                     content=ft.Column([
-                        ft.Row([player_dropdown, player_tag_field, ft.ElevatedButton("📈 Analyser", on_click=analyze_player)]),
+                        ft.Row([player_dropdown, player_tag_field, ft.ElevatedButton("📈 Analyser", on_click=analyze_player), ft.ElevatedButton("🏰 Analyser le clan", on_click=lambda e: threading.Thread(target=analyze_clan, args=(e,)).start()), refresh_battles_checkbox]),
                         ft.Text("💡 Chargez un clan pour avoir la liste déroulante", size=12, italic=True),
                         ft.Divider(),
                         ft.Container(content=player_info, height=600),
@@ -662,6 +714,13 @@ def main(page: ft.Page):
         expand=True,
     )
     
+    def shutdown(e):
+        # The last batch of a scan may still be queued when the window closes
+        notifier.close()
+    
+    page.on_disconnect = shutdown
+    page.on_close = shutdown
+    
     page.add(
         ft.Text("👑 CR Recruiter", size=32, weight=ft.FontWeight.BOLD),
         tabs,
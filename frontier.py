@@ -0,0 +1,123 @@
+import heapq
+import itertools
+from collections import deque
+from datetime import datetime, timezone
+
+# Hit rate assumed for a node before any of its neighbours were checked
+PRIOR_HIT_RATE = 0.1
+
+
+def battle_age_days(battle_time, now=None):
+    # Format: 20231222T153500.000Z
+    if not battle_time:
+        return None
+    try:
+        played = datetime.strptime(battle_time[:15], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return max(0.0, ((now or datetime.now(timezone.utc)) - played).total_seconds() / 86400)
+
+
+class FifoFrontier:
+    """Plain breadth-first order: nodes are expanded in the order they were found."""
+
+    def __init__(self, tags=()):
+        self.items = deque(tags)
+
+    def push(self, tag, **features):
+        self.items.append(tag)
+
+    def pop(self):
+        return self.items.popleft()
+
+    def extend(self, tags):
+        self.items.extend(tags)
+
+    def clear(self):
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def dump(self):
+        """Lines for a checkpoint, in expansion order."""
+        return list(self.items)
+
+    def load(self, lines):
+        # Lines written by a PriorityFrontier carry a score first
+        self.items.extend(line.rsplit("\t", 1)[-1] for line in lines)
+
+
+class PriorityFrontier:
+    """Expands the most promising nodes first instead of the oldest ones.
+
+    Matchmaking pairs players of similar trophies, so a node inside the
+    target band mostly leads to candidates inside it too. The score (lower
+    is better) adds up:
+      - trophies outside [min_trophies, max_trophies], per 1000
+      - days since the battle the node was discovered in (inactive players lead nowhere)
+      - minus the hit rate of the node it was discovered from
+    Ties keep insertion order, so without features this is a FIFO.
+    """
+
+    def __init__(self, min_trophies, max_trophies, tags=(), trophy_weight=1.0, recency_weight=0.1, yield_weight=5.0):
+        self.min_trophies = min_trophies
+        self.max_trophies = max_trophies
+        self.trophy_weight = trophy_weight
+        self.recency_weight = recency_weight
+        self.yield_weight = yield_weight
+        self.heap = []
+        self.counter = itertools.count()
+        self.extend(tags)
+
+    def score(self, trophies=None, last_battle=None, hit_rate=None):
+        score = 0.0
+        if trophies is not None:
+            distance = max(self.min_trophies - trophies, trophies - self.max_trophies, 0)
+            score += self.trophy_weight * distance / 1000
+        age = battle_age_days(last_battle)
+        if age is not None:
+            score += self.recency_weight * age
+        score -= self.yield_weight * (hit_rate if hit_rate is not None else PRIOR_HIT_RATE)
+        return score
+
+    def push(self, tag, **features):
+        score = self.score(**features)
+        # Entries hold their checkpoint line, built once here rather than for every node at each save
+        heapq.heappush(self.heap, (score, next(self.counter), f"{score!r}\t{tag}"))
+
+    def pop(self):
+        line = heapq.heappop(self.heap)[2]
+        return line[line.index("\t") + 1:]
+
+    def extend(self, tags):
+        for tag in tags:
+            self.push(tag)
+
+    def clear(self):
+        self.heap.clear()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (line[line.index("\t") + 1:] for _, _, line in self.heap)
+
+    def dump(self):
+        """"score<TAB>tag" lines for a checkpoint, in heap order: no sort, and `load` keeps the priorities."""
+        return [line for _, _, line in self.heap]
+
+    def load(self, lines):
+        """Add checkpoint lines back; a bare tag (in flight or pruned when saved) gets the prior score."""
+        prior = self.score()
+        for line in lines:
+            score, tab, tag = line.rpartition("\t")
+            try:
+                score = float(score) if tab else prior
+            except ValueError:
+                score = prior
+            self.heap.append((score, next(self.counter), f"{score!r}\t{tag}"))
+        heapq.heapify(self.heap)
@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from paths import data_path
+
+HISTORY_DB = data_path("recruiter_history.sqlite")
+# Where the old front-ends kept it: the working directory
+LEGACY_HISTORY_FILE = "recruiter_history.json"
+DAY = 24 * 60 * 60
+
+
+class HistoryStore:
+    """Players already suggested, in SQLite so a lookup or an append never touches the whole history.
+
+    Each entry keeps when it was first found, its trophies at the time and
+    the scan it came from. With `expiry_days`, older entries no longer count
+    as known and the player can be suggested again (0 = keep forever).
+    `tag in history` is what the crawler's `skip` check uses.
+
+    Recruits are recorded as they are found and committed in batches of
+    `batch_size` rows or every `interval` seconds. Each commit is one
+    fsynced WAL transaction, so a crash loses at most the last batch and
+    never leaves a half-written history, even with both front-ends writing.
+    """
+
+    def __init__(self, path=HISTORY_DB, expiry_days=0, legacy_file=LEGACY_HISTORY_FILE, batch_size=20, interval=2.0):
+        self.path = path
+        self.expiry_days = expiry_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        # WAL lets the Flet and Streamlit apps read while the other one writes;
+        # FULL syncs every commit, which stays cheap because commits are batched
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS players (
+            tag TEXT PRIMARY KEY,
+            first_seen REAL NOT NULL,
+            trophies INTEGER,
+            scan TEXT
+        ) WITHOUT ROWID""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS players_first_seen ON players (first_seen)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, mtime REAL NOT NULL)")
+        self.db.commit()
+        if legacy_file and os.path.exists(legacy_file):
+            self.import_legacy(legacy_file)
+
+    def import_legacy(self, legacy_file):
+        # Old format: a JSON list of tags. Left where it is (it may be tracked in git);
+        # `imports` remembers its mtime so it is read again only if it changes
+        path, seen = os.path.abspath(legacy_file), os.path.getmtime(legacy_file)
+        with self.lock:
+            row = self.db.execute("SELECT mtime FROM imports WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == seen:
+            return
+        try:
+            with open(legacy_file, "r") as f:
+                tags = json.load(f)
+        except:
+            return
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO players (tag, first_seen, scan) VALUES (?, ?, 'import')",
+                [(tag, seen) for tag in tags],
+            )
+            self.db.execute("INSERT OR REPLACE INTO imports VALUES (?, ?)", (path, seen))
+            self.db.commit()
+
+    def cutoff(self):
+        return time.time() - self.expiry_days * DAY if self.expiry_days else 0
+
+    def __contains__(self, tag):
+        with self.lock:
+            row = self.db.execute("SELECT first_seen FROM players WHERE tag = ?", (tag,)).fetchone()
+        return row is not None and row[0] >= self.cutoff()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM players WHERE first_seen >= ?", (self.cutoff(),)).fetchone()[0]
+
+    def record(self, row, scan=None):
+        """Queue one found row ({"Tag", "Trophées", ...}); written with the next batch."""
+        with self.lock:
+            self.pending.append((row["Tag"], time.time(), row.get("Trophées"), scan))
+            due = len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def add(self, rows, scan=None):
+        for row in rows:
+            self.record(row, scan)
+        self.flush()
+
+    def flush(self):
+        """Commit the queued rows. A player seen again keeps its first entry
+        unless it had expired, in which case it starts over."""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending:
+                return
+            cutoff = self.cutoff()
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO players (tag, first_seen, trophies, scan) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (tag) DO UPDATE SET first_seen = excluded.first_seen,"
+                    " trophies = excluded.trophies, scan = excluded.scan WHERE first_seen < ?",
+                    [(*entry, cutoff) for entry in self.pending],
+                )
+            self.pending = []
+
+    def entry(self, tag):
+        with self.lock:
+            row = self.db.execute("SELECT first_seen, trophies, scan FROM players WHERE tag = ?", (tag,)).fetchone()
+        return dict(zip(("first_seen", "trophies", "scan"), row)) if row else None
+
+    def purge(self):
+        """Drop expired entries for good."""
+        if not self.expiry_days:
+            return 0
+        with self.lock:
+            deleted = self.db.execute("DELETE FROM players WHERE first_seen < ?", (self.cutoff(),)).rowcount
+            self.db.commit()
+        return deleted
+
+    def clear(self):
+        with self.lock:
+            self.pending = []
+            self.db.execute("DELETE FROM players")
+            self.db.commit()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
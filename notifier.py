@@ -0,0 +1,153 @@
+import atexit
+import queue
+import threading
+import time
+import requests
+
+TELEGRAM_URL = "https://api.telegram.org/bot{token}/sendMessage"
+MAX_MESSAGE = 4096  # Telegram's limit, in UTF-16 code units
+HEADER = "🎯 Nouvelles Recrues CR !\n━━━━━━━━━━━━━━━━━━\n\n"
+
+
+def message_length(text):
+    # Emojis count twice towards Telegram's limit
+    return len(text.encode("utf-16-le")) // 2
+
+
+def player_entry(i, p):
+    clean_tag = str(p.get('Tag', '')).replace('#', '')
+    return (f"{i}. {p.get('Nom', 'Unknown')}\n"
+            f"   🏆 {p.get('Trophées', 0)} (Best: {p.get('Best', 'N/A')})\n"
+            f"   🃏 {p.get('Carte Fav', 'N/A')}\n"
+            f"   📅 {p.get('Dernière Partie', 'N/A')}\n"
+            f"   👤 https://royaleapi.com/player/{clean_tag}\n"
+            "──────────────────\n")
+
+
+def chunk_messages(entries, header=HEADER, limit=MAX_MESSAGE):
+    """Pack `entries` into as few messages under `limit` as possible, each starting with `header`.
+
+    An entry is only cut when it does not fit in a message on its own.
+    """
+    messages, current = [], header
+    for entry in entries:
+        if current != header and message_length(current + entry) > limit:
+            messages.append(current)
+            current = header
+        while message_length(current + entry) > limit:
+            # Room left counted in characters that may each take two units
+            room = max(1, (limit - message_length(current)) // 2)
+            messages.append(current + entry[:room])
+            entry, current = entry[room:], header
+        current += entry
+    if current != header:
+        messages.append(current)
+    return messages
+
+
+def chat_interval(chat_id):
+    # About one message per second in a private chat, twenty per minute in a group (negative ids)
+    return 3.0 if str(chat_id).startswith("-") else 1.0
+
+
+class TelegramDispatcher:
+    """Sends Telegram notifications from its own thread, so a scan never waits on the Telegram API.
+
+    `send_players` splits a batch into messages under Telegram's limit and
+    queues them; it returns at once, False when the queue is full, in which
+    case the caller keeps those players for its next batch. The sender
+    spaces messages to a chat by `chat_interval`, waits `retry_after` when
+    Telegram answers 429, and retries network and server errors with
+    exponential backoff, at most `retries` times per message.
+    """
+
+    def __init__(self, queue_size=50, retries=5, backoff=1.0, timeout=10):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.next_slot = {}
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        # Daemon threads die with the interpreter; drain what is queued first
+        atexit.register(self.close)
+        return self
+
+    def send(self, bot_token, chat_id, messages):
+        if not bot_token or not chat_id or not messages:
+            return False
+        try:
+            self.queue.put_nowait((bot_token, chat_id, messages))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def send_players(self, bot_token, chat_id, players):
+        return self.send(bot_token, chat_id, chunk_messages(player_entry(i, p) for i, p in enumerate(players, 1)))
+
+    def loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            bot_token, chat_id, messages = item
+            try:
+                for text in messages:
+                    if self.deliver(bot_token, chat_id, text):
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+            except:
+                self.failed += 1
+            finally:
+                self.queue.task_done()
+
+    def deliver(self, bot_token, chat_id, text):
+        delay = self.backoff
+        for _ in range(self.retries + 1):
+            wait = self.next_slot.get(chat_id, 0) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.next_slot[chat_id] = time.monotonic() + chat_interval(chat_id)
+            try:
+                r = self.session.post(TELEGRAM_URL.format(token=bot_token), timeout=self.timeout,
+                                      data={"chat_id": chat_id, "text": text, "disable_web_page_preview": True})
+            except requests.RequestException:
+                r = None
+            if r is not None and r.status_code == 200:
+                return True
+            if r is not None and r.status_code == 429:
+                try:
+                    retry_after = r.json()["parameters"]["retry_after"]
+                except:
+                    retry_after = delay
+                self.next_slot[chat_id] = time.monotonic() + retry_after
+                continue
+            if r is not None and r.status_code < 500:
+                # Wrong token or chat: retrying will not help
+                return False
+            time.sleep(delay)
+            delay *= 2
+        return False
+
+    def stats(self):
+        return {"sent": self.sent, "failed": self.failed, "dropped": self.dropped, "pending": self.queue.qsize()}
+
+    def close(self, timeout=15.0):
+        """Let the queued messages go out for up to `timeout` seconds, then stop."""
+        if not self.thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(max(0.0, deadline - time.monotonic()))
@@ -0,0 +1,28 @@
+import os
+import sys
+
+APP_NAME = "CR Recruiter"
+
+
+def default_data_dir():
+    """Per-user directory for the caches, stores, checkpoints and exports.
+
+    Not the working directory: a macOS .app started from Finder runs in /,
+    which is read-only. CR_RECRUITER_HOME overrides it.
+    """
+    if os.environ.get("CR_RECRUITER_HOME"):
+        return os.environ["CR_RECRUITER_HOME"]
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get("APPDATA") or os.path.expanduser("~"), APP_NAME)
+    if sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~/Library/Application Support"), APP_NAME)
+    return os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "cr-recruiter")
+
+
+DATA_DIR = default_data_dir()
+
+
+def data_path(name):
+    """`name` inside DATA_DIR, creating the directory on first use."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
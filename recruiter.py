@@ -0,0 +1,143 @@
+"""Headless recruiter: runs the same crawl as the apps and streams recruits as JSON lines.
+
+    python -m recruiter --seed "#989R2RPQ" --objectif 50 > recrues.jsonl
+    CR_API_TOKEN=... python -m recruiter --every 60        # daemon, one scan per hour
+    python -m recruiter --export parquet                   # also write recruits to <data dir>/exports as they come
+
+Each line is one event: {"event": "start" | "found" | "progress" | "end", "scan": ..., ...}.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from clash_api import ClashAPI
+from crawler import Crawler
+from async_crawler import AsyncCrawler
+from cache import ResponseCache
+from corpus import BattleCorpus
+from export import EXPORT_DIR, FORMATS, export_path, open_export
+from results import COLUMNS, COLUMN_TYPES
+from checkpoint import Checkpoint
+from history import HistoryStore
+
+
+class Recruiter:
+    """Runs scans without a UI, optionally on a schedule, writing events to `out`."""
+
+    def __init__(self, args, out=sys.stdout):
+        self.args = args
+        self.out = out
+        self.crawler = None
+        self.stopping = threading.Event()
+        self.cache = ResponseCache() if args.cache else None
+        self.history = HistoryStore(expiry_days=args.history_expiry) if args.history else None
+        self.corpus = BattleCorpus() if args.corpus else None
+        workers = args.concurrency if args.engine == "asyncio" else args.workers
+        self.api = ClashAPI(args.token, workers=workers, rate=args.rate, cache=self.cache, corpus=self.corpus)
+
+    def emit(self, event, **data):
+        self.out.write(json.dumps({"event": event, **data}, ensure_ascii=False) + "\n")
+        self.out.flush()
+
+    def stop(self, *_):
+        self.stopping.set()
+        if self.crawler:
+            self.crawler.stop()
+
+    def scan(self):
+        a = self.args
+        scan_id = f"{datetime.now():%Y-%m-%d %H:%M} {a.seed}"
+        checkpoint = Checkpoint("recruiter", resume=a.resume)
+        engine, workers = (AsyncCrawler, a.concurrency) if a.engine == "asyncio" else (Crawler, a.workers)
+        self.crawler = crawler = engine(self.api, a.seed, a.min_trophies, a.max_trophies, a.min_scan, a.objectif, workers,
+                                        skip=self.history if self.history is not None else set(),
+                                        checkpoint=checkpoint, min_yield=a.min_yield)
+        export = open_export(export_path("recrues", a.export), COLUMNS, COLUMN_TYPES) if a.export else None
+        self.emit("start", scan=scan_id, filters=crawler.filters(), engine=a.engine, workers=workers,
+                  export=export.path if export else None)
+        last_progress = time.monotonic()
+        try:
+            for kind, data in crawler.run():
+                if self.stopping.is_set():
+                    crawler.stop()
+                    break
+                if kind in ("found", "restored"):
+                    if self.history is not None:
+                        self.history.record(data, scan_id)
+                    if export is not None:
+                        export.write(data)
+                    self.emit("found", scan=scan_id, restored=kind == "restored", player=data)
+                elif a.progress and time.monotonic() - last_progress >= a.progress:
+                    last_progress = time.monotonic()
+                    self.emit("progress", scan=scan_id, scanned=crawler.scanned, found=len(crawler.found), queue=len(crawler.queue))
+        finally:
+            if self.history is not None:
+                self.history.flush()
+            if export is not None:
+                export.close()
+        self.emit("end", scan=scan_id, summary=crawler.summary(), error=crawler.error, stopped=self.stopping.is_set())
+        return crawler.error is None
+
+    def run(self):
+        while True:
+            started = time.monotonic()
+            ok = self.scan()
+            if not self.args.every or self.stopping.is_set():
+                return ok
+            # Sleep until the next slot; a stop signal cuts the wait short
+            if self.stopping.wait(max(0.0, self.args.every * 60 - (time.monotonic() - started))):
+                return ok
+
+    def close(self):
+        self.api.close()
+        if self.history is not None:
+            self.history.close()
+        if self.cache:
+            self.cache.close()
+        if self.corpus is not None:
+            self.corpus.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m recruiter", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token", default=os.environ.get("CR_API_TOKEN"), help="clé(s) API séparées par des virgules (défaut: $CR_API_TOKEN)")
+    parser.add_argument("--seed", default="#989R2RPQ", help="tag graine")
+    parser.add_argument("--min-trophies", type=int, default=7500)
+    parser.add_argument("--max-trophies", type=int, default=11000)
+    parser.add_argument("--min-scan", type=int, default=7000, help="trophées minimum pour explorer un joueur")
+    parser.add_argument("--objectif", type=int, default=50, help="recrues à trouver par scan")
+    parser.add_argument("--workers", type=int, default=5)
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--concurrency", type=int, default=100, help="requêtes en vol avec --engine asyncio")
+    parser.add_argument("--rate", type=float, default=20, help="requêtes/s par clé")
+    parser.add_argument("--min-yield", type=float, default=0.0, help="élagage: part minimale de recrues (0-1, 0 = désactivé)")
+    parser.add_argument("--resume", action="store_true", help="reprendre le dernier scan interrompu")
+    parser.add_argument("--no-history", dest="history", action="store_false", help="ne pas ignorer ni enregistrer les joueurs déjà trouvés")
+    parser.add_argument("--history-expiry", type=int, default=30, help="jours avant de re-proposer un joueur (0 = jamais)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="ne pas utiliser le cache des réponses API")
+    parser.add_argument("--no-corpus", dest="corpus", action="store_false", help="ne pas enregistrer les combats lus dans la base locale")
+    parser.add_argument("--export", choices=FORMATS, help=f"écrire aussi les recrues dans {EXPORT_DIR} au fil du scan")
+    parser.add_argument("--progress", type=float, default=0, help="émettre un événement progress toutes les N secondes")
+    parser.add_argument("--every", type=float, default=0, help="mode démon: relancer un scan toutes les N minutes")
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error("clé API manquante (--token ou $CR_API_TOKEN)")
+    return args
+
+
+def main(argv=None):
+    recruiter = Recruiter(parse_args(argv))
+    signal.signal(signal.SIGINT, recruiter.stop)
+    signal.signal(signal.SIGTERM, recruiter.stop)
+    try:
+        return 0 if recruiter.run() else 1
+    finally:
+        recruiter.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import threading
+
+COLUMNS = ("Nom", "Trophées", "Best", "Carte Fav", "Dernière Partie", "Tag")
+# Columns that are not text, for typed exports (Parquet)
+COLUMN_TYPES = {"Trophées": int, "Best": int}
+
+
+class ResultBuffer:
+    """Found players kept column by column instead of as a list of dicts.
+
+    Appending a row is a handful of list appends, and a view only ever reads
+    the slice it shows, so the cost per new recruit does not grow with the
+    number already found. `columns` can be handed straight to
+    `pd.DataFrame` without going through one dict per row.
+    """
+
+    def __init__(self, columns=COLUMNS, rows=()):
+        self.names = tuple(columns)
+        self.columns = {name: [] for name in self.names}
+        self.lock = threading.Lock()
+        self.extend(rows)
+
+    def append(self, row):
+        with self.lock:
+            for name, column in self.columns.items():
+                column.append(row.get(name))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.columns[self.names[0]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [dict(zip(self.names, row)) for row in self.rows(i.start, i.stop)]
+        return {name: column[i] for name, column in self.columns.items()}
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def rows(self, start, stop=None):
+        """Rows [start, stop) as tuples in column order."""
+        with self.lock:
+            return list(zip(*(column[start:stop] for column in self.columns.values())))
+
+    def slice(self, start, stop=None):
+        """Rows [start, stop) as a dict of columns."""
+        with self.lock:
+            return {name: column[start:stop] for name, column in self.columns.items()}
+
+    def clear(self):
+        with self.lock:
+            for column in self.columns.values():
+                column.clear()
+
+
+class ResultPager:
+    """Tracks which page of a ResultBuffer is on screen and what changed since the last draw.
+
+    While the last page is shown it follows the scan: new rows are appended
+    to the view and it moves on once the page is full. `refresh()` returns
+    ("reset", rows) when the view must be rebuilt, ("append", rows) when rows
+    only need adding, or None when nothing changed.
+    """
+
+    def __init__(self, buffer, page_size=50):
+        self.buffer = buffer
+        self.page_size = page_size
+        self.page = 0
+        self.shown = 0  # rows of the current page already on screen
+        self.follow = True
+        self.dirty = True
+
+    def pages(self):
+        return max(1, -(-len(self.buffer) // self.page_size))
+
+    def go(self, page):
+        page = min(max(0, page), self.pages() - 1)
+        self.follow = page == self.pages() - 1
+        if page != self.page:
+            self.page = page
+            self.dirty = True
+
+    def reset(self):
+        self.page = 0
+        self.shown = 0
+        self.follow = True
+        self.dirty = True
+
+    def refresh(self):
+        if self.follow:
+            last = self.pages() - 1
+            if last != self.page:
+                self.page = last
+                self.dirty = True
+        start = self.page * self.page_size
+        if self.dirty:
+            self.dirty = False
+            rows = self.buffer.rows(start, start + self.page_size)
+            self.shown = len(rows)
+            return "reset", rows
+        if self.shown < self.page_size:
+            rows = self.buffer.rows(start + self.shown, start + self.page_size)
+            if rows:
+                self.shown += len(rows)
+                return "append", rows
+        return None
@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+
+class ScanWorker:
+    """Runs one crawl on its own thread, independently of whoever is watching it.
+
+    Streamlit reruns the whole script on every click; the worker lives in
+    the session state, so a rerun just reattaches to it instead of
+    restarting or blocking the crawl. Found rows go to `found` (any
+    ResultBuffer-like object), and progress snapshots to `progress`, which
+    the page drains whenever it polls. Only the latest snapshot matters, so
+    when nobody polls the oldest ones are dropped instead of piling up.
+
+    `notify(players) -> bool` is called every `notify_batch` recruits and
+    once more at the end for the rest, on the crawl thread, so it should
+    only queue them (TelegramDispatcher.send_players); players it refuses
+    go out with the next batch. `decorate(row)` can add columns to a
+    found row before it is stored. `export` (a CsvExport/ParquetExport) gets
+    every found row as it comes and is closed when the crawl ends.
+    """
+
+    def __init__(self, crawler, found, history=None, scan_id=None, notify=None, notify_batch=20,
+                 decorate=None, export=None, progress_interval=0.5, progress_size=100):
+        self.crawler = crawler
+        self.found = found
+        self.history = history
+        self.scan_id = scan_id or f"{datetime.now():%Y-%m-%d %H:%M}"
+        self.notify = notify
+        self.notify_batch = notify_batch
+        self.decorate = decorate
+        self.export = export
+        self.progress_interval = progress_interval
+        self.progress = queue.Queue(maxsize=progress_size)
+        self.notif_count = 0
+        self.last_notified = 0
+        self.started = None
+        self.finished = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.crawler.stop()
+
+    def running(self):
+        return self.started is not None and self.finished is None
+
+    def snapshot(self):
+        return {
+            "scanned": self.crawler.scanned,
+            "found": len(self.found),
+            "queue": len(self.crawler.queue),
+            "notifs": self.notif_count,
+            "running": self.finished is None,
+        }
+
+    def publish(self):
+        item = self.snapshot()
+        while True:
+            try:
+                self.progress.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.progress.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def poll(self):
+        """Latest snapshot published since the last poll, or the current state if none."""
+        latest = None
+        while True:
+            try:
+                latest = self.progress.get_nowait()
+            except queue.Empty:
+                return latest or self.snapshot()
+
+    def send(self, upto):
+        players = self.found[self.last_notified:upto]
+        if not players:
+            return
+        # On disk before they are announced
+        if self.history is not None:
+            self.history.flush()
+        if self.notify(players):
+            self.notif_count += 1
+            self.last_notified = upto
+
+    def run(self):
+        crawler = self.crawler
+        last_progress = 0.0
+        try:
+            for kind, data in crawler.run():
+                if self.stopping.is_set():
+                    crawler.stop()
+                    break
+                if kind in ("found", "restored"):
+                    # Persisted as found, so a crash or a stop never re-notifies these players
+                    if self.history is not None:
+                        self.history.record(data, self.scan_id)
+                    row = self.decorate(data) if self.decorate else data
+                    self.found.append(row)
+                    if self.export is not None:
+                        self.export.write(row)
+                    if kind == "restored":
+                        # Already handled by the interrupted run
+                        self.last_notified = len(self.found)
+                    elif self.notify and len(self.found) >= self.last_notified + self.notify_batch:
+                        self.send(len(self.found))
+                if time.monotonic() - last_progress >= self.progress_interval:
+                    last_progress = time.monotonic()
+                    self.publish()
+        except Exception as e:
+            if not crawler.error:
+                crawler.error = f"Erreur: {e}"
+        finally:
+            if self.history is not None:
+                self.history.flush()
+            if self.export is not None:
+                self.export.close()
+            if self.notify:
+                self.send(len(self.found))
+            self.finished = time.time()
+            self.publish()
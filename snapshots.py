@@ -0,0 +1,153 @@
+import sqlite3
+import threading
+import time
+from paths import data_path
+
+SNAPSHOT_DB = data_path("clan_snapshots.sqlite")
+
+
+class ClanSnapshots:
+    """Every clan load kept as a timestamped snapshot of its members.
+
+    A member's last battle is stored with the snapshot, so the next load
+    only needs a battle log for members whose `lastSeen` or trophies moved
+    since (or who just joined, or had no battle on record); the others
+    cannot have played in between.
+    Diffs between two snapshots (joins, leaves, donation and trophy deltas)
+    are read from the database alone.
+    """
+
+    def __init__(self, path=SNAPSHOT_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                clan TEXT NOT NULL,
+                name TEXT,
+                taken REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_clan ON snapshots (clan, taken);
+            CREATE TABLE IF NOT EXISTS members (
+                snapshot INTEGER NOT NULL REFERENCES snapshots (id),
+                tag TEXT NOT NULL,
+                name TEXT,
+                role TEXT,
+                trophies INTEGER,
+                donations INTEGER,
+                received INTEGER,
+                last_seen TEXT,
+                last_battle TEXT,
+                PRIMARY KEY (snapshot, tag)
+            ) WITHOUT ROWID;
+        """)
+        self.db.commit()
+
+    def snapshots(self, clan):
+        """[(id, taken, members)], oldest first."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT s.id, s.taken, COUNT(m.tag) FROM snapshots s LEFT JOIN members m ON m.snapshot = s.id"
+                " WHERE s.clan = ? GROUP BY s.id ORDER BY s.taken",
+                (clan,),
+            ).fetchall()
+
+    def members(self, snapshot):
+        """{tag: {"name", "role", "trophies", ...}} for one snapshot."""
+        with self.lock:
+            cursor = self.db.execute(
+                "SELECT tag, name, role, trophies, donations, received, last_seen, last_battle FROM members WHERE snapshot = ?",
+                (snapshot,),
+            )
+            names = [c[0] for c in cursor.description][1:]
+            return {row[0]: dict(zip(names, row[1:])) for row in cursor}
+
+    def latest(self, clan):
+        with self.lock:
+            row = self.db.execute("SELECT id FROM snapshots WHERE clan = ? ORDER BY taken DESC LIMIT 1", (clan,)).fetchone()
+        return self.members(row[0]) if row else {}
+
+    def stale(self, clan, members):
+        """Split the current memberList into (tags needing a battle log, {tag: last battle} still valid).
+
+        A stored last battle of None is always refetched: it may be a fetch
+        that failed rather than an empty log.
+        """
+        previous = self.latest(clan)
+        fetch, known = [], {}
+        for m in members:
+            tag = m.get('tag', '')
+            old = previous.get(tag)
+            if (old and old["last_battle"] and old["last_seen"] and old["last_seen"] == m.get('lastSeen')
+                    and old["trophies"] == m.get('trophies')):
+                known[tag] = old["last_battle"]
+            else:
+                fetch.append(tag)
+        return fetch, known
+
+    def save(self, clan_data, last_battles, taken=None):
+        """Store one load. `last_battles` maps each member tag to its latest battleTime (None if private)."""
+        with self.lock, self.db:
+            snapshot = self.db.execute(
+                "INSERT INTO snapshots (clan, name, taken) VALUES (?, ?, ?)",
+                (clan_data.get('tag', ''), clan_data.get('name', ''), taken or time.time()),
+            ).lastrowid
+            self.db.executemany(
+                "INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(snapshot, m.get('tag', ''), m.get('name', ''), m.get('role', ''), m.get('trophies', 0),
+                  m.get('donations', 0), m.get('donationsReceived', 0), m.get('lastSeen'), last_battles.get(m.get('tag', '')))
+                 for m in clan_data.get('memberList', [])],
+            )
+        return snapshot
+
+    def diff(self, old, new):
+        """Changes between two snapshot ids: joined / left members and per-member deltas.
+
+        Donations restart from 0 every week, so a drop counts the new
+        total as the week's donations instead of a negative delta.
+        """
+        before, after = self.members(old), self.members(new)
+        changes = []
+        for tag in after.keys() & before.keys():
+            a, b = before[tag], after[tag]
+            donations = b["donations"] - a["donations"] if b["donations"] >= a["donations"] else b["donations"]
+            trophies = b["trophies"] - a["trophies"]
+            if donations or trophies or a["role"] != b["role"]:
+                changes.append({"tag": tag, "name": b["name"], "donations": donations, "trophies": trophies,
+                                "role": b["role"] if a["role"] != b["role"] else None})
+        return {
+            "joined": [{"tag": tag, **after[tag]} for tag in after.keys() - before.keys()],
+            "left": [{"tag": tag, **before[tag]} for tag in before.keys() - after.keys()],
+            "changed": sorted(changes, key=lambda c: -c["donations"]),
+        }
+
+    def purge(self, clan, keep=100):
+        """Keep only the `keep` most recent snapshots of a clan."""
+        with self.lock, self.db:
+            old = [row[0] for row in self.db.execute(
+                "SELECT id FROM snapshots WHERE clan = ? ORDER BY taken DESC LIMIT -1 OFFSET ?", (clan, keep))]
+            self.db.executemany("DELETE FROM members WHERE snapshot = ?", [(i,) for i in old])
+            self.db.executemany("DELETE FROM snapshots WHERE id = ?", [(i,) for i in old])
+        return len(old)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def member_activity(api, store, clan_data):
+    """Yield (member, last battleTime or None) for every member of `clan_data`.
+
+    Members unchanged since the previous snapshot come first, straight from
+    the store; the others are fetched concurrently and follow as their logs
+    arrive.
+    """
+    members = clan_data.get('memberList', [])
+    by_tag = {m.get('tag', ''): m for m in members}
+    fetch, known = store.stale(clan_data.get('tag', ''), members)
+    for tag, battle_time in known.items():
+        yield by_tag[tag], battle_time
+    for tag, battles in api.battle_logs(fetch):
+        yield by_tag[tag], (battles[0].get('battleTime') or None) if battles else None
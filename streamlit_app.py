@@ -1,127 +1,68 @@
+import os
 import streamlit as st
-import requests
-import time
 import pandas as pd
-import os
-import json
 import plotly.express as px
 from datetime import datetime
-from collections import deque
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# --- HISTORY MANAGEMENT ---
-HISTORY_FILE = "recruiter_history.json"
-
-def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r') as f:
-                return set(json.load(f))
-        except:
-            return set()
-    return set()
-
-def save_history(tags):
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(list(tags), f)
-
-def clear_history():
-    if os.path.exists(HISTORY_FILE):
-        os.remove(HISTORY_FILE)
-    return set()
+from clash_api import ClashAPI, APIUnavailable, NoValidKey
+from crawler import Crawler
+from async_crawler import AsyncCrawler
+from cache import ResponseCache
+from checkpoint import Checkpoint
+from history import HistoryStore
+from scan_worker import ScanWorker
+from snapshots import ClanSnapshots, member_activity
+from analytics import BattleTable
+from corpus import BattleCorpus, battle_logs
+from results import COLUMNS, COLUMN_TYPES, ResultBuffer
+from export import EXPORT_DIR, FORMATS, export_path, open_export
+from notifier import TelegramDispatcher
 
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="CR Recruiter", page_icon="👑", layout="wide")
 st.title("👑 Clash Royale Recruiter")
 
+# Found recruits plus the two profile links shown in the table
+FOUND_COLUMNS = COLUMNS + ("Lien CR", "RoyaleAPI")
+# Rows shown while a scan runs; the full table comes once it is over
+RECENT_ROWS = 200
+
+@st.cache_resource
+def get_history(expiry_days):
+    # One connection per server process and expiry; the data itself is shared through the SQLite file
+    return HistoryStore(expiry_days=expiry_days)
+
 # --- SESSION STATE ---
-if 'scanning' not in st.session_state:
-    st.session_state.scanning = False
+# The scan runs in a ScanWorker kept here, so reruns reattach to it instead of restarting it
+if 'worker' not in st.session_state:
+    st.session_state.worker = None
+if 'start_requested' not in st.session_state:
+    st.session_state.start_requested = False
 if 'found' not in st.session_state:
-    st.session_state.found = []
-if 'last_notified' not in st.session_state:
-    st.session_state.last_notified = 0
+    st.session_state.found = ResultBuffer(FOUND_COLUMNS)
+
+def scan_running():
+    return st.session_state.worker is not None and st.session_state.worker.running()
 
 def start_scan():
-    st.session_state.scanning = True
-    st.session_state.found = []
-    st.session_state.last_notified = 0
+    # The worker is built further down, once the sidebar values are known
+    st.session_state.start_requested = True
 
 def stop_scan():
-    st.session_state.scanning = False
+    if st.session_state.worker:
+        st.session_state.worker.stop()
 
-# --- TELEGRAM ---
-def send_telegram(bot_token, chat_id, players):
-    """Envoie une liste de joueurs via Telegram avec liens CR"""
-    if not bot_token or not chat_id:
-        return False
-    
-    def escape_md(text):
-        for char in ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']:
-            text = text.replace(char, '\\' + char)
-        return text
-    
-    message = "🎯 Nouvelles Recrues CR !\n"
-    message += "━━━━━━━━━━━━━━━━━━\n\n"
-    
-    for i, p in enumerate(players, 1):
-        clean_tag = p['Tag'].replace('#', '')
-        name = escape_md(str(p.get('Nom', 'Unknown')))
-        message += f"{i}. {name}\n"
-        message += f"   🏆 {p.get('Trophées', 0)} (Best: {p.get('Best', 'N/A')})\n"
-        message += f"   🃏 {p.get('Carte Fav', 'N/A')}\n"
-        message += f"   📅 {p.get('Dernière Partie', 'N/A')}\n"
-        message += f"   👤 https://royaleapi.com/player/{clean_tag}\n"
-        message += "──────────────────\n"
-    
-    if len(message) > 4000:
-        message = message[:4000] + "\n... (tronqué)"
-    
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    data = {
-        "chat_id": chat_id,
-        "text": message,
-        "disable_web_page_preview": True
+def with_links(row):
+    clean_tag = row["Tag"].replace('#', '')
+    return {
+        **row,
+        "Lien CR": f"clashroyale://playerInfo%3Fid={clean_tag}",
+        "RoyaleAPI": f"https://royaleapi.com/player/{clean_tag}"
     }
-    
-    try:
-        r = requests.post(url, data=data, timeout=10)
-        return r.status_code == 200
-    except:
-        return False
-
-# --- API FUNCTIONS ---
-def get_headers():
-    return {"Authorization": f"Bearer {api_token}", "Accept": "application/json"}
-
-def get_battle_log(tag):
-    url = f"https://api.clashroyale.com/v1/players/{tag.replace('#', '%23')}/battlelog"
-    try:
-        r = requests.get(url, headers=get_headers(), timeout=10)
-        return r.json() if r.status_code == 200 else []
-    except:
-        return []
-
-def get_player(tag):
-    url = f"https://api.clashroyale.com/v1/players/{tag.replace('#', '%23')}"
-    try:
-        r = requests.get(url, headers=get_headers(), timeout=10)
-        return r.json() if r.status_code == 200 else None
-    except:
-        return None
-
-def get_clan(tag):
-    url = f"https://api.clashroyale.com/v1/clans/{tag.replace('#', '%23')}"
-    try:
-        r = requests.get(url, headers=get_headers(), timeout=10)
-        return r.json() if r.status_code == 200 else None
-    except:
-        return None
 
 # --- SIDEBAR CONFIG ---
 with st.sidebar:
     st.header("⚙️ Configuration")
-    api_token = st.text_input("Clé API CR", type="password")
+    api_token = st.text_input("Clé(s) API CR", type="password", help="Plusieurs clés séparées par des virgules pour répartir la charge")
     seed_tag = st.text_input("Tag Graine", value="#989R2RPQ")
     
     st.subheader("🎯 Filtres")
@@ -129,9 +70,14 @@ with st.sidebar:
     max_trophies = st.number_input("Trophées Max", value=11000, step=100)
     min_scan = st.number_input("Qualité Scan", value=7000, step=100)
     objectif = st.number_input("Objectif Recrues", value=50, step=10)
+    min_yield = st.number_input("Élagage (% recrues min)", value=0.0, min_value=0.0, max_value=100.0, step=1.0,
+                                help="Ne plus explorer autour des joueurs dont les adversaires du palier ne donnent presque aucune recrue (0 = désactivé)")
     
     st.subheader("⚡ Performance")
     workers = st.slider("Workers parallèles", 1, 10, 5)
+    rate = st.number_input("Requêtes/s (par clé)", value=20, min_value=1, step=5)
+    engine = st.selectbox("Moteur", ["threads", "asyncio"], help="asyncio garde des centaines de requêtes en vol sans un thread par requête")
+    concurrency = st.number_input("Requêtes en vol (asyncio)", value=100, min_value=10, step=10, disabled=engine != "asyncio")
     
     st.divider()
     
@@ -146,21 +92,49 @@ with st.sidebar:
     # --- HISTORIQUE ---
     st.subheader("📜 Historique")
     use_history = st.checkbox("Ignorer joueurs déjà trouvés", value=True)
-    history = load_history()
+    resume_scan = st.checkbox("Reprendre le dernier scan interrompu", value=True, help="Repart de la file et des joueurs déjà vus au lieu du tag graine")
+    expiry_days = st.number_input("Re-proposer après (jours)", value=30, min_value=0, step=5, help="0 = ne jamais re-proposer un joueur déjà trouvé")
+    history = get_history(expiry_days)
     st.caption(f"{len(history)} joueurs en historique")
     if st.button("🗑️ Vider l'historique"):
-        clear_history()
+        history.clear()
         st.success("Historique vidé !")
         st.rerun()
     
+    export_format = st.selectbox("📥 Format d'export", FORMATS, help=f"Les recrues sont écrites dans {EXPORT_DIR} au fur et à mesure du scan; parquet pour les gros scans")
+    
     st.divider()
     
     # Boutons Start/Stop
     col_start, col_stop = st.columns(2)
     with col_start:
-        st.button("🚀 Lancer", on_click=start_scan, type="primary", use_container_width=True, disabled=st.session_state.scanning)
+        st.button("🚀 Lancer", on_click=start_scan, type="primary", use_container_width=True, disabled=scan_running())
     with col_stop:
-        st.button("🛑 Stop", on_click=stop_scan, type="secondary", use_container_width=True, disabled=not st.session_state.scanning)
+        st.button("🛑 Stop", on_click=stop_scan, type="secondary", use_container_width=True, disabled=not scan_running())
+
+@st.cache_resource
+def get_cache():
+    return ResponseCache()
+
+@st.cache_resource
+def get_corpus():
+    return BattleCorpus()
+
+@st.cache_resource
+def get_snapshots():
+    return ClanSnapshots()
+
+@st.cache_resource
+def get_notifier():
+    # One sender thread per server process, outliving sessions; it drains its queue when the server exits
+    return TelegramDispatcher().start()
+
+@st.cache_resource
+def get_api(token, pool_size, rate):
+    # Kept across reruns so the keep-alive pool and rate limiter survive widget interactions
+    return ClashAPI(token, workers=pool_size, rate=rate, cache=get_cache(), corpus=get_corpus())
+
+api = get_api(api_token, workers, rate)
 
 # --- TABS ---
 tab_scan, tab_stats, tab_clan, tab_analysis = st.tabs(["🔍 Recherche", "📊 Statistiques", "🏰 Mon Clan", "🕹️ Analyse Joueur"])
@@ -176,108 +150,91 @@ with tab_scan:
     log_area = st.empty()
     results_area = st.empty()
 
-    if st.session_state.scanning:
+    if st.session_state.start_requested:
+        st.session_state.start_requested = False
         if not api_token:
             st.error("⚠️ Entrez votre clé API")
-            st.session_state.scanning = False
+        elif not scan_running():
+            try:
+                export = open_export(export_path("recrues", export_format), FOUND_COLUMNS, COLUMN_TYPES)
+            except (ImportError, OSError) as e:
+                export = None
+                st.error(f"❌ Export impossible: {e}")
+            if export is not None:
+                engine_cls, engine_workers = (AsyncCrawler, concurrency) if engine == "asyncio" else (Crawler, workers)
+                checkpoint = Checkpoint("streamlit", resume=resume_scan)
+                crawler = engine_cls(api, seed_tag, min_trophies, max_trophies, min_scan, objectif, engine_workers,
+                                     skip=history if use_history else set(), checkpoint=checkpoint, min_yield=min_yield / 100)
+                st.session_state.found = ResultBuffer(FOUND_COLUMNS)
+                notify = (lambda players: get_notifier().send_players(telegram_token, telegram_chat_id, players)) if telegram_chat_id else None
+                st.session_state.worker = ScanWorker(
+                    crawler, st.session_state.found, history=history, scan_id=f"{datetime.now():%Y-%m-%d %H:%M} {seed_tag}",
+                    notify=notify, notify_batch=telegram_batch, decorate=with_links, export=export,
+                ).start()
+                st.session_state.engine_label = f"{engine_workers} workers ({engine})"
+                # Redraw the sidebar with Stop enabled
+                st.rerun()
+
+    worker = st.session_state.worker
+
+    @st.fragment(run_every=1.0)
+    def scan_progress():
+        # Reruns on its own every second while the worker is busy; the rest of the page is left alone
+        progress = worker.poll()
+        metric_scanned.metric("🔍 Scannés", progress["scanned"])
+        metric_found.metric("✅ Trouvés", progress["found"])
+        metric_queue.metric("📋 File", progress["queue"])
+        metric_telegram.metric("📱 Notifs", progress["notifs"])
+        if progress["running"]:
+            log_area.info(f"⏳ {progress['scanned']} profils analysés... (file: {progress['queue']}) · {st.session_state.engine_label}")
+            # Only the latest recruits while scanning, so a poll costs the same at 50 or 5000 rows
+            total = len(worker.found)
+            if total:
+                start = max(0, total - RECENT_ROWS)
+                results_area.dataframe(pd.DataFrame(worker.found.slice(start, total), index=range(start, total)), use_container_width=True)
         else:
-            queue = deque([seed_tag])
-            visited = {seed_tag}
-            found = []
-            scanned = 0
-            metric_scanned.metric("🔍 Scannés", 0)
-            metric_found.metric("✅ Trouvés", 0)
-            metric_queue.metric("📋 File", 1)
-            metric_telegram.metric("📱 Notifs", 0)
-            log_area.info(f"Démarrage avec {workers} workers...")
-            notif_count = 0
+            # The scan just ended: rerun the whole page so stats and buttons catch up
+            st.rerun()
 
-            while queue and len(found) < objectif and st.session_state.scanning:
-                current = queue.popleft()
-                battles = get_battle_log(current)
-                tags_to_check = []
-                for battle in battles:
-                    for opp in battle.get('opponent', []):
-                        tag = opp['tag']
-                        if tag not in visited:
-                            visited.add(tag)
-                            tags_to_check.append(tag)
-                
-                if tags_to_check and st.session_state.scanning:
-                    with ThreadPoolExecutor(max_workers=workers) as executor:
-                        futures = {executor.submit(get_player, t): t for t in tags_to_check}
-                        for future in as_completed(futures):
-                            if len(found) >= objectif or not st.session_state.scanning:
-                                break
-                            tag = futures[future]
-                            scanned += 1
-                            try:
-                                player = future.result()
-                                if player:
-                                    trophies = player.get("trophies", 0)
-                                    has_clan = "clan" in player
-                                    if not has_clan and min_trophies <= trophies <= max_trophies:
-                                        if use_history and tag in history:
-                                            continue
-                                        clean_tag = tag.replace('#', '')
-                                        best_trophies = player.get("bestTrophies", 0)
-                                        fav_card = player.get("currentFavouriteCard", {}).get("name", "N/A")
-                                        player_battles = get_battle_log(tag)
-                                        last_battle = "N/A"
-                                        if player_battles:
-                                            lb_time = player_battles[0].get("battleTime", "N/A")
-                                            if lb_time != "N/A":
-                                                last_battle = f"{lb_time[0:4]}-{lb_time[4:6]}-{lb_time[6:8]}"
-                                        
-                                        found.append({
-                                            "Nom": player["name"], "Trophées": trophies, "Best": best_trophies,
-                                            "Carte Fav": fav_card, "Dernière Partie": last_battle, "Tag": tag,
-                                            "Lien CR": f"clashroyale://playerInfo%3Fid={clean_tag}",
-                                            "RoyaleAPI": f"https://royaleapi.com/player/{clean_tag}"
-                                        })
-                                        
-                                        if telegram_chat_id and len(found) >= st.session_state.last_notified + telegram_batch:
-                                            batch_start = st.session_state.last_notified
-                                            batch_end = len(found)
-                                            players_to_send = found[batch_start:batch_end]
-                                            if send_telegram(telegram_token, telegram_chat_id, players_to_send):
-                                                notif_count += 1
-                                                st.session_state.last_notified = batch_end
-                                                metric_telegram.metric("📱 Notifs", notif_count)
-                                    
-                                    if trophies >= min_scan:
-                                        queue.append(tag)
-                            except:
-                                pass
-                    metric_scanned.metric("🔍 Scannés", scanned)
-                    metric_found.metric("✅ Trouvés", len(found))
-                    metric_queue.metric("📋 File", len(queue))
-                    if found:
-                        results_area.dataframe(found, use_container_width=True)
-                        st.session_state.found = found
-                log_area.info(f"⏳ {scanned} profils analysés... (file: {len(queue)})")
-                time.sleep(0.05)
-            
-            st.session_state.scanning = False
-            st.session_state.found = found
-            if found:
-                new_tags = {p['Tag'] for p in found}
-                updated_history = history.union(new_tags)
-                save_history(updated_history)
-            if telegram_chat_id and len(found) > st.session_state.last_notified:
-                remaining = found[st.session_state.last_notified:]
-                send_telegram(telegram_token, telegram_chat_id, remaining)
-            if found:
-                st.success(f"🎉 Terminé ! {len(found)} recrues trouvées.")
-                df = pd.DataFrame(found)
-                st.download_button("📥 Télécharger CSV", df.to_csv(index=False), "recrues.csv", "text/csv")
-    elif st.session_state.found:
-        results_area.dataframe(st.session_state.found, use_container_width=True)
+    if worker is not None and scan_running():
+        scan_progress()
+    elif worker is not None:
+        crawler = worker.crawler
+        found = worker.found
+        metric_scanned.metric("🔍 Scannés", crawler.scanned)
+        metric_found.metric("✅ Trouvés", len(found))
+        metric_queue.metric("📋 File", len(crawler.queue))
+        metric_telegram.metric("📱 Notifs", worker.notif_count)
+        conn = api.connection_stats()
+        hits = get_cache().stats()
+        st.caption(f"🔌 {conn['opened']} connexions ouvertes, {conn['reused']} réutilisées · 💾 cache {hits['hits']} hits / {hits['misses']} misses / {hits['revalidated']} revalidés (304)")
+        summary = crawler.summary()
+        if summary["requests_per_recruit"]:
+            pruning = f" · ✂️ {summary['pruned']} élagués" if summary["pruned"] else ""
+            st.caption(f"📈 {summary['requests']} requêtes, {summary['requests_per_recruit']:.1f} par recrue{pruning}")
+        telegram = get_notifier().stats()
+        if telegram["pending"] or telegram["failed"]:
+            st.caption(f"📱 Telegram: {telegram['sent']} messages envoyés, {telegram['pending']} en attente, {telegram['failed']} échoués")
+        if crawler.error:
+            st.error(f"❌ {crawler.error}")
+        if len(api.keys) > 1:
+            st.dataframe(api.key_stats(), use_container_width=True, hide_index=True)
+        if found:
+            log_area.success(f"🎉 Terminé ! {len(found)} recrues trouvées.")
+            results_area.dataframe(pd.DataFrame(found.columns), use_container_width=True)
+            # Served from the file the worker streamed to, not re-serialised from the table
+            export = worker.export
+            with open(export.path, "rb") as f:
+                st.download_button(f"📥 Télécharger {export.path.rsplit('.', 1)[-1].upper()}", f, os.path.basename(export.path),
+                                   "text/csv" if export.path.endswith(".csv") else "application/vnd.apache.parquet")
+            st.caption(f"📁 {export.path}")
+        elif worker.stopping.is_set():
+            log_area.info("⏹️ Scan arrêté")
 
 with tab_stats:
     st.subheader("📊 Statistiques des Recrues")
     if st.session_state.found:
-        df = pd.DataFrame(st.session_state.found)
+        df = pd.DataFrame(st.session_state.found.columns)
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("📊 Total", len(df))
         col2.metric("🏆 Moyenne", f"{df['Trophées'].mean():.0f}")
@@ -296,24 +253,31 @@ with tab_clan:
     st.subheader("🏰 Dashboard du Clan")
     clan_tag = st.text_input("Tag du Clan", value="#GPYQUC8U")
     if st.button("📊 Charger les données"):
-        clan_data = get_clan(clan_tag)
-        if clan_data:
-            st.markdown(f"### {clan_data.get('name', 'N/A')} `{clan_data.get('tag', '')}`")
-            col1, col2, col3, col4 = st.columns(4)
-            col1.metric("👥 Membres", f"{len(clan_data.get('memberList', []))}/50")
-            col2.metric("🏆 Trophées Requis", clan_data.get('requiredTrophies', 0))
-            col3.metric("🎖️ Score Guerre", clan_data.get('clanWarTrophies', 0))
-            col4.metric("💰 Dons/semaine", clan_data.get('donationsPerWeek', 0))
-            st.divider()
-            members = clan_data.get('memberList', [])
-            if members:
-                member_data = []
-                progress_bar = st.progress(0, text="Chargement des activités...")
-                for idx, m in enumerate(members):
-                    battles = get_battle_log(m.get('tag', ''))
-                    status, last_battle, days_ago = "🔒", "Privé", 999
-                    if battles:
-                        lb_time = battles[0].get('battleTime', '')
+        try:
+            clan_data = api.get_clan(clan_tag)
+        except APIUnavailable:
+            clan_data = None
+        try:
+            if clan_data:
+                st.markdown(f"### {clan_data.get('name', 'N/A')} `{clan_data.get('tag', '')}`")
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("👥 Membres", f"{len(clan_data.get('memberList', []))}/50")
+                col2.metric("🏆 Trophées Requis", clan_data.get('requiredTrophies', 0))
+                col3.metric("🎖️ Score Guerre", clan_data.get('clanWarTrophies', 0))
+                col4.metric("💰 Dons/semaine", clan_data.get('donationsPerWeek', 0))
+                st.divider()
+                members = clan_data.get('memberList', [])
+                if members:
+                    member_data = []
+                    progress_bar = st.progress(0, text="Chargement des activités...")
+                    members_area = st.empty()
+                    snapshots = get_snapshots()
+                    rank = {m.get('tag', ''): i for i, m in enumerate(members)}
+                    last_battles = {}
+                    for idx, (m, lb_time) in enumerate(member_activity(api, snapshots, clan_data)):
+                        tag = m.get('tag', '')
+                        last_battles[tag] = lb_time
+                        status, last_battle, days_ago = "🔒", "Privé", 999
                         if lb_time:
                             try:
                                 b_date = datetime.strptime(lb_time[:15], '%Y%m%dT%H%M%S')
@@ -325,57 +289,100 @@ with tab_clan:
                                 elif days_ago <= 7: status = "🔴 7 jours"
                                 else: status = f"⚫ {days_ago}j"
                             except: pass
-                    member_data.append({
-                        "Nom": m.get('name', ''), "Rôle": m.get('role', '').replace('coLeader', 'Co-Leader').replace('elder', 'Aîné').replace('member', 'Membre').replace('leader', 'Chef'),
-                        "Trophées": m.get('trophies', 0), "Dons": m.get('donations', 0), "Dernière Partie": last_battle, "Statut": status, "Inactif (j)": days_ago if days_ago < 999 else "N/A"
-                    })
-                    progress_bar.progress((idx + 1) / len(members))
-                progress_bar.empty()
-                df_m = pd.DataFrame(member_data)
-                st.dataframe(df_m, use_container_width=True, hide_index=True)
-                inactive = df_m[df_m['Inactif (j)'].apply(lambda x: isinstance(x, int) and x >= 7)]
-                if len(inactive) > 0:
-                    st.subheader(f"🔴 Membres inactifs 7+ jours ({len(inactive)})")
-                    st.dataframe(inactive, use_container_width=True, hide_index=True)
+                        member_data.append({
+                            "Nom": m.get('name', ''), "Rôle": m.get('role', '').replace('coLeader', 'Co-Leader').replace('elder', 'Aîné').replace('member', 'Membre').replace('leader', 'Chef'),
+                            "Trophées": m.get('trophies', 0), "Dons": m.get('donations', 0), "Dernière Partie": last_battle, "Statut": status, "Inactif (j)": days_ago if days_ago < 999 else "N/A",
+                            "Tag": tag
+                        })
+                        progress_bar.progress((idx + 1) / len(members))
+                        members_area.dataframe(member_data, use_container_width=True, hide_index=True)
+                    progress_bar.empty()
+                    snapshots.save(clan_data, last_battles)
+                    member_data.sort(key=lambda d: rank[d['Tag']])
+                    df_m = pd.DataFrame(member_data)
+                    members_area.dataframe(df_m, use_container_width=True, hide_index=True)
+                    inactive = df_m[df_m['Inactif (j)'].apply(lambda x: isinstance(x, int) and x >= 7)]
+                    if len(inactive) > 0:
+                        st.subheader(f"🔴 Membres inactifs 7+ jours ({len(inactive)})")
+                        st.dataframe(inactive, use_container_width=True, hide_index=True)
+        except NoValidKey as e:
+            st.error(f"❌ {e}")
+
+    # Read from the stored snapshots only, no API call
+    history_clan = "#" + clan_tag.strip().lstrip("#").upper()
+    saved = get_snapshots().snapshots(history_clan)
+    if len(saved) >= 2:
+        st.divider()
+        st.subheader("📜 Évolution du clan")
+        labels = {sid: f"{datetime.fromtimestamp(taken):%Y-%m-%d %H:%M} ({count} membres)" for sid, taken, count in saved}
+        col_from, col_to = st.columns(2)
+        old_id = col_from.selectbox("Depuis", list(labels), index=len(saved) - 2, format_func=labels.get)
+        new_id = col_to.selectbox("Jusqu'à", list(labels), index=len(saved) - 1, format_func=labels.get)
+        changes = get_snapshots().diff(old_id, new_id)
+        french = {"name": "Nom", "tag": "Tag", "trophies": "Trophées", "role": "Rôle", "donations": "Dons"}
+        col1, col2, col3 = st.columns(3)
+        col1.metric("➕ Arrivées", len(changes['joined']))
+        col2.metric("➖ Départs", len(changes['left']))
+        col3.metric("💝 Dons", sum(c['donations'] for c in changes['changed']))
+        if changes['joined']:
+            st.dataframe(pd.DataFrame(changes['joined'])[list(french)[:4]].rename(columns=french), use_container_width=True, hide_index=True)
+        if changes['left']:
+            st.dataframe(pd.DataFrame(changes['left'])[list(french)[:4]].rename(columns=french), use_container_width=True, hide_index=True)
+        if changes['changed']:
+            st.dataframe(pd.DataFrame(changes['changed']).rename(columns=french), use_container_width=True, hide_index=True)
 
 with tab_analysis:
     st.subheader("🕹️ Analyse détaillée du joueur")
-    analysis_tag = st.text_input("Tag du joueur à analyser", value="#PL0Q8UGR")
-    if st.button("📈 Lancer l'analyse"):
+    scope = st.radio("Portée", ["Joueur", "Clan entier", "Recrues du scan", "Tous les combats"], horizontal=True,
+                     help="Clan entier: tous les membres du dernier chargement du clan (onglet Mon Clan). "
+                          "Tous les combats: chaque combat enregistré localement, une seule fois")
+    if scope == "Joueur":
+        analysis_tag = st.text_input("Tag du joueur à analyser", value="#PL0Q8UGR")
+        analysis_tags = [analysis_tag]
+    elif scope == "Recrues du scan":
+        analysis_tags = list(st.session_state.found.columns["Tag"])
+        st.caption(f"{len(analysis_tags)} recrues trouvées" if analysis_tags else "Lancez d'abord une recherche.")
+    elif scope == "Tous les combats":
+        analysis_tags = None
+    else:
+        clan_members = get_snapshots().latest("#" + clan_tag.strip().lstrip("#").upper())
+        analysis_tags = list(clan_members)
+        st.caption(f"{len(analysis_tags)} membres de {clan_tag}" if analysis_tags else "Chargez d'abord le clan dans l'onglet Mon Clan.")
+    refresh_battles = st.checkbox("Actualiser les combats depuis l'API", value=False,
+                                  help="Sinon les journaux récupérés il y a moins de 5 min sont relus depuis la base locale; les autres sont demandés à l'API")
+    corpus_stats = get_corpus().stats()
+    st.caption(f"🗄️ {corpus_stats['battles']} combats en base ({corpus_stats['bytes'] / 1e6:.1f} Mo, {corpus_stats['bytes_per_battle']:.0f} o/combat)")
+    if st.button("📈 Lancer l'analyse") and (analysis_tags or scope == "Tous les combats"):
         with st.spinner("Analyse en cours..."):
-            battles = get_battle_log(analysis_tag)
-            if battles:
-                wins, losses, draws, card_stats = 0, 0, 0, {}
-                for b in battles:
-                    t_c = sum([p.get('crowns', 0) for p in b.get('team', [])])
-                    o_c = sum([p.get('crowns', 0) for p in b.get('opponent', [])])
-                    outcome = "win" if t_c > o_c else ("loss" if t_c < o_c else "draw")
-                    if outcome == "win": wins += 1
-                    elif outcome == "loss": losses += 1
-                    else: draws += 1
-                    for opp in b.get('opponent', []):
-                        for card in opp.get('cards', []):
-                            name = card.get('name')
-                            if name not in card_stats: card_stats[name] = {'wins': 0, 'losses': 0, 'draws': 0, 'total': 0}
-                            card_stats[name]['total'] += 1
-                            card_stats[name][outcome + 's'] += 1
-                
-                total = wins + losses + draws
-                wr = (wins / total) * 100 if total > 0 else 0
+            # Logs flattened into columns; every aggregate below is a group-by over them
+            if analysis_tags is None:
+                table = BattleTable.from_corpus(get_corpus())
+            else:
+                try:
+                    table = BattleTable.from_logs(battle_logs(api, get_corpus(), analysis_tags, refresh_battles))
+                except NoValidKey as e:
+                    st.error(f"❌ {e}")
+                    table = BattleTable()
+            if len(table):
+                record = table.record()
                 col1, col2, col3, col4 = st.columns(4)
-                col1.metric("🏁 Matchs", total); col2.metric("✅ Victoires", wins); col3.metric("❌ Défaites", losses); col4.metric("📈 Win Rate", f"{wr:.1f}%")
-                st.plotly_chart(px.pie(values=[wins, losses, draws], names=["Victoires", "Défaites", "Égalités"], color_discrete_sequence=["green", "red", "gray"]), use_container_width=True)
+                col1.metric("🏁 Matchs", record['battles']); col2.metric("✅ Victoires", record['wins']); col3.metric("❌ Défaites", record['losses']); col4.metric("📈 Win Rate", f"{record['win_rate']:.1f}%")
+                st.plotly_chart(px.pie(values=[record['wins'], record['losses'], record['draws']], names=["Victoires", "Défaites", "Égalités"], color_discrete_sequence=["green", "red", "gray"]), use_container_width=True)
                 
-                rows = []
-                for name, s in card_stats.items():
-                    rows.append({"Carte": name, "Rencontres": s['total'], "Victoires": s['wins'], "Défaites": s['losses'], "Win Rate %": round((s['wins']/s['total'])*100, 1)})
-                df_c = pd.DataFrame(rows)
+                df_c = pd.DataFrame(table.card_matchups(min_count=2)).rename(columns={
+                    "card": "Carte", "total": "Rencontres", "wins": "Victoires", "losses": "Défaites", "draws": "Égalités", "win_rate": "Win Rate %"})
                 col_l, col_r = st.columns(2)
                 with col_l:
                     st.write("#### 💪 Tes victimes")
-                    st.dataframe(df_c[df_c['Rencontres'] >= 2].nlargest(10, 'Win Rate %'), use_container_width=True, hide_index=True)
+                    st.dataframe(df_c.nlargest(10, 'Win Rate %'), use_container_width=True, hide_index=True)
                 with col_r:
                     st.write("#### ⚠️ Tes bourreaux")
-                    st.dataframe(df_c[df_c['Rencontres'] >= 2].nsmallest(10, 'Win Rate %'), use_container_width=True, hide_index=True)
+                    st.dataframe(df_c.nsmallest(10, 'Win Rate %'), use_container_width=True, hide_index=True)
+                if scope == "Clan entier":
+                    df_p = pd.DataFrame(table.per_player())
+                    df_p.insert(0, "Nom", df_p["tag"].map(lambda t: clan_members[t]["name"]))
+                    st.write("#### 📈 Win rate par membre")
+                    st.dataframe(df_p.rename(columns={"tag": "Tag", "battles": "Matchs", "wins": "Victoires", "losses": "Défaites", "win_rate": "Win Rate %"})
+                                 .sort_values("Win Rate %", ascending=False), use_container_width=True, hide_index=True)
             else:
                 st.warning("Aucun combat trouvé.")
\ No newline at end of file
@@ -1,38 +1,21 @@
 import streamlit as st
-import requests
 import time
 import pandas as pd
-import os
-import json
 import plotly.express as px
 from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# --- HISTORY MANAGEMENT ---
-HISTORY_FILE = "recruiter_history.json"
-
-def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r') as f:
-                return set(json.load(f))
-        except:
-            return set()
-    return set()
-
-def save_history(tags):
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(list(tags), f)
-
-def clear_history():
-    if os.path.exists(HISTORY_FILE):
-        os.remove(HISTORY_FILE)
-    return set()
+from clash_api import ClashAPI, APIUnavailable, NoValidKey
+from history import HistoryStore
+from notifier import TelegramDispatcher
 
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="CR Recruiter", page_icon="👑", layout="wide")
 st.title("👑 Clash Royale Recruiter")
 
+@st.cache_resource
+def get_history():
+    return HistoryStore()
+
 # --- SESSION STATE ---
 if 'scanning' not in st.session_state:
     st.session_state.scanning = False
@@ -51,51 +34,6 @@ def start_scan():
 def stop_scan():
     st.session_state.scanning = False
 
-# --- TELEGRAM ---
-def send_telegram(bot_token, chat_id, players):
-    """Envoie une liste de joueurs via Telegram avec liens CR"""
-    if not bot_token or not chat_id:
-        print("DEBUG: Missing bot_token or chat_id")
-        return False
-    
-    # Escape special Markdown characters in names
-    def escape_md(text):
-        for char in ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']:
-            text = text.replace(char, '\\' + char)
-        return text
-    
-    message = "🎯 Nouvelles Recrues CR !\n"
-    message += "━━━━━━━━━━━━━━━━━━\n\n"
-    
-    for i, p in enumerate(players, 1):
-        clean_tag = p['Tag'].replace('#', '')
-        name = escape_md(str(p.get('Nom', 'Unknown')))
-        message += f"{i}. {name}\n"
-        message += f"   🏆 {p.get('Trophées', 0)} (Best: {p.get('Best', 'N/A')})\n"
-        message += f"   🃏 {p.get('Carte Fav', 'N/A')}\n"
-        message += f"   📅 {p.get('Dernière Partie', 'N/A')}\n"
-        message += f"   👤 https://royaleapi.com/player/{clean_tag}\n"
-        message += "──────────────────\n"
-    
-    # Limite Telegram: 4096 chars
-    if len(message) > 4000:
-        message = message[:4000] + "\n... (tronqué)"
-    
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    data = {
-        "chat_id": chat_id,
-        "text": message,
-        "disable_web_page_preview": True
-    }
-    
-    try:
-        r = requests.post(url, data=data, timeout=10)
-        print(f"DEBUG Telegram: status={r.status_code}, response={r.text[:200]}")
-        return r.status_code == 200
-    except Exception as e:
-        print(f"DEBUG Telegram error: {e}")
-        return False
-
 # --- SIDEBAR CONFIG ---
 with st.sidebar:
     st.header("⚙️ Configuration")
@@ -124,10 +62,10 @@ with st.sidebar:
     # --- HISTORIQUE ---
     st.subheader("📜 Historique")
     use_history = st.checkbox("Ignorer joueurs déjà trouvés", value=True, help="Ne pas afficher les joueurs déjà trouvés lors de précédentes recherches")
-    history = load_history()
+    history = get_history()
     st.caption(f"{len(history)} joueurs en historique")
     if st.button("🗑️ Vider l'historique"):
-        clear_history()
+        history.clear()
         st.success("Historique vidé !")
         st.rerun()
     
@@ -140,33 +78,16 @@ with st.sidebar:
     with col_stop:
         st.button("🛑 Stop", on_click=stop_scan, type="secondary", use_container_width=True, disabled=not st.session_state.scanning)
 
-# --- API FUNCTIONS ---
-def get_headers():
-    return {"Authorization": f"Bearer {api_token}", "Accept": "application/json"}
+# --- API CLIENT ---
+@st.cache_resource
+def get_notifier():
+    return TelegramDispatcher().start()
 
-def get_battle_log(tag):
-    url = f"https://api.clashroyale.com/v1/players/{tag.replace('#', '%23')}/battlelog"
-    try:
-        r = requests.get(url, headers=get_headers(), timeout=10)
-        return r.json() if r.status_code == 200 else []
-    except:
-        return []
+@st.cache_resource
+def get_api(token, pool_size):
+    return ClashAPI(token, workers=pool_size)
 
-def get_player(tag):
-    url = f"https://api.clashroyale.com/v1/players/{tag.replace('#', '%23')}"
-    try:
-        r = requests.get(url, headers=get_headers(), timeout=10)
-        return r.json() if r.status_code == 200 else None
-    except:
-        return None
-
-def get_clan(tag):
-    url = f"https://api.clashroyale.com/v1/clans/{tag.replace('#', '%23')}"
-    try:
-        r = requests.get(url, headers=get_headers(), timeout=10)
-        return r.json() if r.status_code == 200 else None
-    except:
-        return None
+api = get_api(api_token, workers)
 
 # --- TABS ---
 tab_scan, tab_stats, tab_clan, tab_analysis = st.tabs(["🔍 Recherche", "📊 Statistiques", "🏰 Mon Clan", "🕹️ Analyse Joueur"])
@@ -203,7 +124,10 @@ with tab_scan:
 
             while queue and len(found) < objectif and st.session_state.scanning:
                 current = queue.popleft()
-                battles = get_battle_log(current)
+                try:
+                    battles = api.get_battle_log(current)
+                except APIUnavailable:
+                    battles = []
                 
                 # Collecter tous les tags
                 tags_to_check = []
@@ -217,7 +141,7 @@ with tab_scan:
                 # Traitement PARALLELE
                 if tags_to_check and st.session_state.scanning:
                     with ThreadPoolExecutor(max_workers=workers) as executor:
-                        futures = {executor.submit(get_player, tag): tag for tag in tags_to_check}
+                        futures = {executor.submit(api.get_player, tag): tag for tag in tags_to_check}
                         
                         for future in as_completed(futures):
                             if len(found) >= objectif or not st.session_state.scanning:
@@ -244,7 +168,10 @@ with tab_scan:
                                         fav_card = player.get("currentFavouriteCard", {}).get("name", "N/A")
                                         
                                         # Récupérer la date du dernier combat
-                                        player_battles = get_battle_log(tag)
+                                        try:
+                                            player_battles = api.get_battle_log(tag)
+                                        except APIUnavailable:
+                                            player_battles = []
                                         if player_battles:
                                             last_battle = player_battles[0].get("battleTime", "N/A")
                                             # Format: 20231222T153500.000Z -> 2023-12-22
@@ -270,7 +197,7 @@ with tab_scan:
                                             batch_end = len(found)
                                             players_to_send = found[batch_start:batch_end]
                                             
-                                            if send_telegram(telegram_token, telegram_chat_id, players_to_send):
+                                            if get_notifier().send_players(telegram_token, telegram_chat_id, players_to_send):
                                                 notif_count += 1
                                                 st.session_state.last_notified = batch_end
                                                 metric_telegram.metric("📱 Notifs", notif_count)
@@ -297,17 +224,15 @@ with tab_scan:
             
             # Sauvegarder dans l'historique
             if found:
-                new_tags = {p['Tag'] for p in found}
-                updated_history = history.union(new_tags)
-                save_history(updated_history)
+                history.add(found, scan=seed_tag)
             
             # Envoyer les derniers joueurs restants
             if telegram_chat_id and len(found) > st.session_state.last_notified:
                 remaining = found[st.session_state.last_notified:]
-                send_telegram(telegram_token, telegram_chat_id, remaining)
+                get_notifier().send_players(telegram_token, telegram_chat_id, remaining)
             
             if found:
-                st.success(f"🎉 Terminé ! {len(found)} recrues trouvées. ({len(history) + len(found)} en historique)")
+                st.success(f"🎉 Terminé ! {len(found)} recrues trouvées. ({len(history)} en historique)")
                 df = pd.DataFrame(found)
                 st.download_button("📥 Télécharger CSV", df.to_csv(index=False), "recrues.csv", "text/csv")
             else:
@@ -364,7 +289,10 @@ with tab_clan:
     clan_tag = st.text_input("Tag du Clan", value="#GPYQUC8U")
     
     if st.button("📊 Charger les données", type="primary"):
-        clan_data = get_clan(clan_tag)
+        try:
+            clan_data = api.get_clan(clan_tag)
+        except APIUnavailable:
+            clan_data = None
         
         if clan_data:
             # Infos générales
@@ -383,61 +311,70 @@ with tab_clan:
             if members:
                 member_data = []
                 progress_bar = st.progress(0, text="Chargement des activités...")
+                members_area = st.empty()
+                by_tag = {m.get('tag', ''): m for m in members}
+                rank = {tag: i for i, tag in enumerate(by_tag)}
                 
-                for idx, m in enumerate(members):
-                    # Récupérer l'activité via battlelog
-                    battles = get_battle_log(m.get('tag', ''))
+                # Récupérer l'activité via battlelog, tous les membres en parallèle
+                try:
+                    for idx, (tag, battles) in enumerate(api.battle_logs(by_tag)):
+                        m = by_tag[tag]
                     
-                    if battles:
-                        last_battle_time = battles[0].get('battleTime', '')
-                        if last_battle_time:
-                            # Format: 20231222T153500.000Z
-                            from datetime import datetime
-                            try:
-                                battle_date = datetime.strptime(last_battle_time[:15], '%Y%m%dT%H%M%S')
-                                days_ago = (datetime.now() - battle_date).days
-                                last_battle = battle_date.strftime('%Y-%m-%d %H:%M')
+                        if battles:
+                            last_battle_time = battles[0].get('battleTime', '')
+                            if last_battle_time:
+                                # Format: 20231222T153500.000Z
+                                from datetime import datetime
+                                try:
+                                    battle_date = datetime.strptime(last_battle_time[:15], '%Y%m%dT%H%M%S')
+                                    days_ago = (datetime.now() - battle_date).days
+                                    last_battle = battle_date.strftime('%Y-%m-%d %H:%M')
                                 
-                                # Status d'activité
-                                if days_ago == 0:
-                                    status = "🟢 Actif"
-                                elif days_ago <= 1:
-                                    status = "🟡 Hier"
-                                elif days_ago <= 3:
-                                    status = "🟠 3 jours"
-                                elif days_ago <= 7:
-                                    status = "🔴 7 jours"
-                                else:
-                                    status = f"⚫ {days_ago}j"
-                            except:
+                                    # Status d'activité
+                                    if days_ago == 0:
+                                        status = "🟢 Actif"
+                                    elif days_ago <= 1:
+                                        status = "🟡 Hier"
+                                    elif days_ago <= 3:
+                                        status = "🟠 3 jours"
+                                    elif days_ago <= 7:
+                                        status = "🔴 7 jours"
+                                    else:
+                                        status = f"⚫ {days_ago}j"
+                                except:
+                                    last_battle = "N/A"
+                                    days_ago = 999
+                                    status = "❓"
+                            else:
                                 last_battle = "N/A"
                                 days_ago = 999
                                 status = "❓"
                         else:
-                            last_battle = "N/A"
+                            last_battle = "Privé"
                             days_ago = 999
-                            status = "❓"
-                    else:
-                        last_battle = "Privé"
-                        days_ago = 999
-                        status = "🔒"
+                            status = "🔒"
                     
-                    member_data.append({
-                        "Nom": m.get('name', ''),
-                        "Rôle": m.get('role', '').replace('coLeader', 'Co-Leader').replace('elder', 'Aîné').replace('member', 'Membre').replace('leader', 'Chef'),
-                        "Trophées": m.get('trophies', 0),
-                        "Dons": m.get('donations', 0),
-                        "Reçus": m.get('donationsReceived', 0),
-                        "Dernière Partie": last_battle,
-                        "Inactif (j)": days_ago if days_ago < 999 else "N/A",
-                        "Statut": status,
-                        "Tag": m.get('tag', '')
-                    })
+                        member_data.append({
+                            "Nom": m.get('name', ''),
+                            "Rôle": m.get('role', '').replace('coLeader', 'Co-Leader').replace('elder', 'Aîné').replace('member', 'Membre').replace('leader', 'Chef'),
+                            "Trophées": m.get('trophies', 0),
+                            "Dons": m.get('donations', 0),
+                            "Reçus": m.get('donationsReceived', 0),
+                            "Dernière Partie": last_battle,
+                            "Inactif (j)": days_ago if days_ago < 999 else "N/A",
+                            "Statut": status,
+                            "Tag": tag
+                        })
                     
-                    progress_bar.progress((idx + 1) / len(members), text=f"Analyse {idx+1}/{len(members)}...")
-                    time.sleep(0.05)
+                        progress_bar.progress((idx + 1) / len(members), text=f"Analyse {idx+1}/{len(members)}...")
+                        members_area.dataframe(member_data, use_container_width=True, hide_index=True)
+                except NoValidKey as e:
+                    st.error(f"❌ {e}")
                 
                 progress_bar.empty()
+                members_area.empty()
+                # Remettre l'ordre du classement du clan
+                member_data.sort(key=lambda d: rank[d['Tag']])
                 
                 # Sauvegarder les membres pour l'onglet Analyse
                 st.session_state.clan_members = member_data
@@ -498,8 +435,12 @@ with tab_analysis:
     
     if st.button("📈 Lancer l'analyse", key="btn_analysis"):
         with st.spinner("Analyse en cours..."):
-            player = get_player(analysis_tag)
-            battles = get_battle_log(analysis_tag)
+            try:
+                player = api.get_player(analysis_tag)
+                battles = api.get_battle_log(analysis_tag)
+            except APIUnavailable:
+                player, battles = None, []
+                st.warning("⏳ API saturée, réessayez dans un instant")
             
             if player:
                 # --- PROFIL DU JOUEUR ---